@@ -0,0 +1,87 @@
+############ frequency alignment between baseline files and FRED series #########################
+############ the baseline's frequency is detected from its dates, and every fetched series is ######
+############ aggregated onto the baseline's periods (mean, last or sum) with vectorized period ####
+############ arithmetic, so monthly series line up with quarterly baselines instead of being ######
+############ mostly dropped by an inner join on exact dates ######################################
+
+import numpy as np
+import pandas as pd
+
+### median spacing between observations, in days -> pandas period frequency ###
+FREQUENCY_THRESHOLDS = [(4, 'D'), (20, 'W'), (60, 'M'), (250, 'Q')]
+ANNUAL = 'A'
+
+AGGREGATIONS = {'mean': 'Average over the period', 'last': 'End of period', 'sum': 'Sum over the period'}
+
+
+def detect_frequency(dates):
+    dates = np.unique(pd.to_datetime(dates).dropna().to_numpy(dtype='datetime64[D]'))
+    if dates.shape[0] < 2:
+        return ANNUAL
+    spacing = np.median(np.diff(dates).astype(float))
+    for days, freq in FREQUENCY_THRESHOLDS:
+        if spacing < days:
+            return freq
+    return ANNUAL
+
+
+### quarter start dates in FRED's format, for the "normalize dates" button ###
+def normalize_quarter_dates(dates):
+    return pd.to_datetime(pd.Series(dates), yearfirst=True).dt.to_period('Q').dt.start_time.dt.strftime('%Y-%m-%d')
+
+
+### baseline frame (Date, value) -> (frequency, values indexed by period) ###
+def baseline_periods(frame):
+    dates = pd.to_datetime(frame['Date'], yearfirst=True)
+    freq = detect_frequency(dates)
+    values = pd.Series(pd.to_numeric(frame.iloc[:, 1], errors='coerce').to_numpy(dtype=float), index=pd.PeriodIndex(dates, freq=freq))
+    return freq, values.groupby(level=0).last().sort_index()
+
+
+def aggregate_series(frames, freq, how='mean'):
+    ### frames maps series ID -> frame of (date, value) as fetched. all of them are ####
+    ### aggregated onto periods of freq in one groupby, giving a periods x series ######
+    ### frame of raw values, before any percent change ################################
+    codes = list(frames)
+    lengths = [frames[c].shape[0] for c in codes]
+    if sum(lengths) == 0:
+        return pd.DataFrame(columns=codes, dtype=float)
+
+    dates = pd.to_datetime(np.concatenate([frames[c]['date'].to_numpy() for c in codes]), yearfirst=True)
+    long = pd.DataFrame({
+        'period': pd.PeriodIndex(dates, freq=freq),
+        'code': pd.Categorical(np.repeat(codes, lengths), categories=codes),
+        'value': pd.to_numeric(np.concatenate([frames[c]['value'].to_numpy() for c in codes]), errors='coerce'),
+    })
+    grouped = long.groupby(['period', 'code'], observed=True)['value']
+    aggregated = grouped.sum(min_count=1) if how == 'sum' else getattr(grouped, how)()
+    return aggregated.unstack('code').reindex(columns=codes)
+
+
+def transform_panel(panel, freq, pct_change=0):
+    ### fill in missing periods, then, if pct_change is not 0, apply it over that many ####
+    ### of each series' own observations, so a gap in the calendar (a weekend, holiday ####
+    ### or missed release) is bridged instead of breaking the change ######################
+    if panel.shape[0] == 0:
+        return panel
+    panel = panel.reindex(pd.period_range(panel.index.min(), panel.index.max(), freq=freq))
+    if pct_change != 0:
+        values = panel.to_numpy(dtype=float)
+        observed = ~np.isnan(values)
+        ### each observation's number within its series, and the rows of each series' ####
+        ### observations in order, so the one pct_change observations back can be read ####
+        number = np.cumsum(observed, axis=0) - 1 - pct_change
+        rows = np.argsort(~observed, axis=0, kind='stable')
+        previous = np.take_along_axis(values, np.take_along_axis(rows, np.maximum(number, 0), axis=0), axis=0)
+        previous[number < 0] = np.nan
+        with np.errstate(divide='ignore', invalid='ignore'):
+            change = values / previous - 1
+        change[np.isinf(change) | np.isnan(change)] = 0
+        panel = pd.DataFrame(np.where(observed, change * 100, np.nan), index=panel.index, columns=panel.columns)
+    return panel
+
+
+def align_series(frames, freq, how='mean', pct_change=0):
+    ### aggregate_series then transform_panel: fetched frames in, a periods x series ####
+    ### frame ready to correlate out ####################################################
+    return transform_panel(aggregate_series(frames, freq, how), freq, pct_change)
@@ -1,9 +1,65 @@
 # The shinyswatch package provides themes from https://bootswatch.com/
 
+import warmup
 import shinyswatch
 from shiny import App, Inputs, Outputs, Session, render, ui, reactive, req
 import pandas as pd
+import time
+from concurrent.futures import ThreadPoolExecutor
+from starlette.applications import Starlette
+from starlette.routing import Mount, Route
 from datetime import datetime
+from alignment import AGGREGATIONS
+from category_crawler import shared_bucket
+from category_index import CategoryIndex
+import exports
+from observation_store import ObservationStore
+from panel_cache import PanelCache
+from series_catalog import SeriesCatalog, DEFAULT_MAX_AGE_DAYS
+from shared_cache import CachedObservations, SeriesCache
+
+warmup.record("app imports", time.perf_counter() - warmup.STARTED)
+
+############ the category tree used by the category search tab is read once at startup, ##########
+############ from its compiled form (categories.npz) when that is up to date ######################
+with warmup.step("category index"):
+    category_index = CategoryIndex.load("categories.csv")
+
+############ snapshot of the series in each category, built with `python series_catalog.py` #######
+with warmup.step("series catalog"):
+    series_catalog = SeriesCatalog.load()
+
+### the FRED key's request quota, shared by every session's crawls and fetches ###
+fred_bucket = shared_bucket('api_key.txt')
+
+### observations pulled from FRED are kept on disk and shared by every session ###
+with warmup.step("observation store"):
+    observation_store = ObservationStore(bucket=fred_bucket)
+
+### recently fetched series are also held in memory, and sessions asking for the same ###
+### series at the same time share one fetch ############################################
+shared_observations = CachedObservations(observation_store, SeriesCache())
+
+### columns the results table can be sorted on. the correlations sort by absolute value ###
+RESULT_SORT_CHOICES = {
+    'pearsoncorr': "|Pearson correlation|",
+    'spearmancorr': "|Spearman correlation|",
+    'pearson_pval': "Pearson p-value",
+    'spearman_pval': "Spearman p-value",
+    'lag': "Lag",
+    'indicator_code': "Series ID",
+    'baseline_data': "Baseline file",
+    'duplicate_of': "Representative series",
+    'pearson_window_mean': "Mean rolling Pearson",
+    'pearson_window_std': "Rolling Pearson standard deviation",
+    'pearson_window_frac': "Share of windows above the rolling threshold (Pearson)",
+    'spearman_window_mean': "Mean rolling Spearman",
+    'spearman_window_std': "Rolling Spearman standard deviation",
+    'spearman_window_frac': "Share of windows above the rolling threshold (Spearman)",
+}
+
+### long running FRED work is handed off to these threads so sessions stay responsive ###
+background_pool = ThreadPoolExecutor(max_workers=4)
 
 ####### everything in the app_ui section relates to the ui side #########################
 #########################################################################################
@@ -33,6 +89,7 @@ app_ui = ui.page_navbar(
                         ui.output_ui("top_level_dropdown"),
                         ui.output_ui("dropdown_level_2"),
                         ui.output_ui("dropdown_level_3"),
+                        ui.input_checkbox("refresh_catalog", "Refresh categories older than " + str(DEFAULT_MAX_AGE_DAYS) + " days from FRED", value=False),
                         ui.input_action_button("begin_series_search", "Start Series API Query",width="30%",class_="btn-primary")
                         ),
                     ui.nav(
@@ -56,7 +113,27 @@ app_ui = ui.page_navbar(
                 ui.tags.p("Note: For quarterly data, a value of 1 yields a quarter over quarter percent change. A value of 4 yields, year over year percent change." + 
                           "A value of 0 will result in the raw values being used."),
                 ui.input_slider("lag",  "Set the number of lagging periods that will be applied to the baseline data.", min = 0,max = 10, value=5),
-                ui.input_action_button("analysis_begin", "Begin Analysis", width="30%",class_="btn-primary")
+                ui.input_select("aggregation", "How series more frequent than the baseline are converted to its frequency", AGGREGATIONS),
+                ui.input_checkbox("screen", "Screening mode: only compute full statistics for series passing a quick Pearson check", value=False),
+                ui.panel_conditional("input.screen",
+                    ui.input_slider("screen_bound", "Keep series whose |Pearson| reaches this at any lag", min=0, max=1, value=0.5),
+                    ui.tags.p("Series below the bound are left out of the results. A bound at or below the Pearson threshold on the Results tab removes nothing from the table.")
+                ),
+                ui.input_checkbox("rolling", "Rolling-window mode: also summarize correlations over sliding windows", value=False),
+                ui.panel_conditional("input.rolling",
+                    ui.input_slider("rolling_window", "Window length, in baseline periods", min=8, max=60, value=20),
+                    ui.input_slider("rolling_threshold", "Count windows where |correlation| reaches", min=0, max=1, value=0.65),
+                    ui.tags.p("Each series gets the mean and standard deviation of its window correlations, and the fraction of windows at or above the threshold.")
+                ),
+                ui.input_checkbox("dedup", "Duplicate grouping: correlate one series per group of near-identical series", value=False),
+                ui.panel_conditional("input.dedup",
+                    ui.input_slider("dedup_threshold", "Treat series as duplicates when their correlation with each other reaches", min=0.95, max=1, value=0.999, step=0.001),
+                    ui.tags.p("Series observed on the same dates that correlate this closely (the same indicator in other units, adjusted copies, regional copies) are grouped. " +
+                              "Each group's first series is correlated, and the others are given its results, with its ID in the duplicate_of column.")
+                ),
+                ui.input_checkbox("resume_run", "Resume run: skip series already finished by an interrupted run with the same files and settings", value=False),
+                ui.input_action_button("analysis_begin", "Begin Analysis", width="30%",class_="btn-primary"),
+                ui.output_ui("analysis_progress")
 
                 ################# end side bar ###############################################################
                 #############################################################################################
@@ -82,6 +159,16 @@ app_ui = ui.page_navbar(
             #####################################################################################################
         ),
     ),
+    ####################### diagnostics: per-stage timings and counters for this process ############
+    ui.nav(
+        "Diagnostics",
+        ui.tags.h4("Pipeline Diagnostics"),
+        ui.tags.p("Counters and stage timings since the server started. The same numbers are served in Prometheus format at /metrics."),
+        ui.output_data_frame("diagnostics_table"),
+        ui.tags.h4("Startup"),
+        ui.tags.p("How long this server process took to start, and to import the modules the buttons use in the background."),
+        ui.output_data_frame("startup_table")
+    ),
     ####################### page title ##############################################################
     title="FRED Data Mining Tool"
 )
@@ -90,11 +177,10 @@ app_ui = ui.page_navbar(
 ################ that occur server side ########################################################################
 def server(input: Inputs, output: Outputs, session: Session):
 
-    ############ read in data to populate the dropdowns in the category search tab #########################
+    ############ the dropdowns in the category search tab are populated from category_index ##########
     ############ top_level categories populate the first dropdown ########################################
     ########### The dropdowns are hierarchical, so the one below depends on those above ##################
-    categories_df = pd.read_csv("categories.csv")
-    top_level_categories = categories_df[categories_df['parent_id'] == 0]
+    top_level_categories = category_index.child_categories([0])
 
     ### reactive values respond to changes the user makes ###########################################
     ### this one waits for the user to input baseline data ##########################################
@@ -105,16 +191,11 @@ def server(input: Inputs, output: Outputs, session: Session):
     @reactive.Effect
     @reactive.event(input.baseline_files)
     def upload_contents():
-        for i in input.baseline_files():
-            df = pd.read_csv(i['datapath'])
-            if isinstance(df.iloc[0,1],str):
-                df = df.replace('%', '', regex=True)
-                df.iloc[:,1] = pd.to_numeric(df.iloc[:,1])
-            else:
-                pass
-            df = df.iloc[:,0:2]
-            baseline_df_list.set(baseline_df_list() + [{i['name']:df}])
-        baseline_df_list.set([{k: v for d in baseline_df_list() for k, v in d.items()}])
+        from ingest import parse_baselines
+
+        uploaded = dict(baseline_df_list()[0]) if baseline_df_list() else {}
+        uploaded.update(parse_baselines(input.baseline_files()))
+        baseline_df_list.set([uploaded])
 
     ### server logic to create the data table displaying the uploaded #######################
     ### baseline data ###################################
@@ -152,43 +233,22 @@ def server(input: Inputs, output: Outputs, session: Session):
                 ui.output_data_frame("input_data_table")
         )
     
-    #### server logic to perform data normalization upon button press ###################3
+    #### server logic to perform data normalization upon button press ###################
+    #### every date is moved to the start of its quarter, matching FRED's quarterly dates ##
     @reactive.Effect
     @reactive.event(input.is_quarterly)
     def date_normalize():
+        from alignment import normalize_quarter_dates
+
         df = baseline_df_list()[0][input.base_display()]
-        row_count = df.shape[0]
-        df['Date']  = df['Date'].astype(str)
-        day = '01'
-        new_date = []
-        for i in range(0,row_count):
-            if df.loc[i,'Date'][5:7] == '01' or df.loc[i,'Date'][5:7] == '02' or df.loc[i,'Date'][5:7] == '03':
-                year = df.loc[i,'Date'][0:4]
-                month = '-01-'
-                new_date.append(year + month + day)
-            elif df.loc[i,'Date'][5:7] == '04' or df.loc[i,'Date'][5:7] == '05' or df.loc[i,'Date'][5:7] == '06':
-                year = df.loc[i,'Date'][0:4]
-                month = '-04-'
-                new_date.append(year + month + day)
-            elif df.loc[i,'Date'][5:7] == '07' or df.loc[i,'Date'][5:7] == '08' or df.loc[i,'Date'][5:7] == '09':
-                year = df.loc[i,'Date'][0:4]
-                month = '-07-'
-                new_date.append(year + month + day)
-            elif df.loc[i,'Date'][5:7] == '10' or df.loc[i,'Date'][5:7] == '11' or df.loc[i,'Date'][5:7] == '12':
-                year = df.loc[i,'Date'][0:4]
-                month = '-10-'
-                new_date.append(year + month + day)
-            else:
-                pass
-        df['Date'] = new_date
-        #df['Date'] = pd.to_datetime(df['Date'],format="%Y-%m-%d")
+        df['Date'] = normalize_quarter_dates(df['Date']).to_numpy()
         baseline_df_list()[0][input.base_display()] = df
 
     #### server logic to create top dropdown ################
     @output
     @render.ui
     def top_level_dropdown():
-        return(ui.input_selectize("top_dropdown", "Select a top level category:", top_level_categories['name'].values.tolist(),multiple = True))
+        return(ui.input_selectize("top_dropdown", "Select a top level category:", [name for i, name in top_level_categories],multiple = True))
     
     ### reactive value to store the IDs of the FRED category names selected ######
     ### in the top dropdown #######################################
@@ -200,8 +260,7 @@ def server(input: Inputs, output: Outputs, session: Session):
     @reactive.Effect
     @reactive.event(input.top_dropdown)
     def add_top_level_ids():
-        top_ids = categories_df[(categories_df['name'].isin(input.top_dropdown())) & (categories_df['parent_id'] == 0)]
-        top_level_id_list.set(top_ids['id'].values.tolist())
+        top_level_id_list.set(category_index.selected_children([0], input.top_dropdown()))
     
     ### based on the top level IDs create the second level ########
     ### category dropdown ########################################
@@ -211,9 +270,9 @@ def server(input: Inputs, output: Outputs, session: Session):
     @reactive.event(top_level_id_list)
     def dropdown_level_2():
 
-        level_2_categories = categories_df[categories_df["parent_id"].isin(top_level_id_list())]
+        level_2_categories = category_index.child_categories(top_level_id_list())
 
-        return(ui.input_selectize('dropdown2', 'Select 2nd level categories',level_2_categories['name'].values.tolist(),multiple=True))
+        return(ui.input_selectize('dropdown2', 'Select 2nd level categories',[name for i, name in level_2_categories],multiple=True))
     
     ### reactive value to store the IDs from the FRED categories #####
     ### selected  by 2nd dropdown ##############3
@@ -223,19 +282,16 @@ def server(input: Inputs, output: Outputs, session: Session):
     @reactive.Effect
     @reactive.event(input.dropdown2, top_level_id_list)
     def add_level_2_ids():
-        level_2_ids = categories_df.loc[(categories_df['name'].isin(input.dropdown2())) & (categories_df['parent_id'].isin(top_level_id_list()))]
-        level_2_id_list.set(level_2_ids['id'].values.tolist())
+        level_2_id_list.set(category_index.selected_children(top_level_id_list(), input.dropdown2()))
     
     ### create third dropdown ######
     @output
     @render.ui
     @reactive.event(level_2_id_list)
     def dropdown_level_3():
-        #level_2_ids = categories_df[categories_df["id"].isin(level_2_id_list())]
-        #level_2_ids = level_2_ids['id'].values.tolist()
-        level_3_categories = categories_df[categories_df['parent_id'].isin(level_2_id_list())]
+        level_3_categories = category_index.child_categories(level_2_id_list())
 
-        return(ui.input_selectize('dropdown3', "Select 3rd level categories", level_3_categories['name'].values.tolist(),multiple=True))
+        return(ui.input_selectize('dropdown3', "Select 3rd level categories", [name for i, name in level_3_categories],multiple=True))
     
 
     ## store IDs selected in 3rd dropdown #####
@@ -246,8 +302,7 @@ def server(input: Inputs, output: Outputs, session: Session):
     @reactive.Effect
     @reactive.event(input.dropdown3,level_2_id_list)
     def add_level_3_ids():
-        level_3_ids = categories_df.loc[(categories_df['name'].isin(input.dropdown3())) & (categories_df["parent_id"].isin(level_2_id_list()))]
-        level_3_id_list.set(level_3_ids['id'].values.tolist())
+        level_3_id_list.set(category_index.selected_children(level_2_id_list(), input.dropdown3()))
 
     ### reactive list to store all category IDs from all dropdowns ####
     ## which will be used to query FRED API in analysis portion #####
@@ -262,17 +317,11 @@ def server(input: Inputs, output: Outputs, session: Session):
     @reactive.Effect
     @reactive.event(level_3_id_list,level_2_id_list,top_level_id_list)
     def create_series_search_list():
-        lvl2_parent_id = categories_df[categories_df["id"].isin(level_2_id_list())]
-        lvl2_parent_id = lvl2_parent_id['parent_id'].values.tolist()
+        lvl2_parent_id = [category_index.parent[i] for i in level_2_id_list()]
+        lvl3_parent_id = [category_index.parent[i] for i in level_3_id_list()]
 
-        lvl3_parent_id = categories_df[categories_df["id"].isin(level_3_id_list())]
-        lvl3_parent_id = lvl3_parent_id['parent_id'].values.tolist()
-        
-        
         series_list = top_level_id_list() + level_2_id_list() + level_3_id_list()
-        print(series_list)
         series_list = set(series_list)
-        print(series_list)
         series_list = series_list - set(lvl2_parent_id) - set(lvl3_parent_id)
         print(series_list)
         series_search_list.set(series_list)
@@ -292,106 +341,68 @@ def server(input: Inputs, output: Outputs, session: Session):
 
     #### On button click, start querying the FRED API for ###############
     ### Series within the selected categories #########################
+    ### the crawl runs on a background thread and series are streamed ##
+    ### into full_series_list as they arrive ##########################
+    crawl_job = reactive.Value(None)
+
     @reactive.Effect
     @reactive.event(input.begin_series_search)
     def prep_series_data():
         from full_fred.fred import Fred
-        from datetime import datetime
-        import time
+        from series_catalog import refresh_categories
+        import metrics
 
-        fred = Fred('api_key.txt')
-        fred.get_api_key_file()
         # make sure the values from any old searches are deleted
         full_series_list.set([])
-        
-        # descend the categories to lowest point, then get series in that
-        # subcategory
-        for i in series_search_list():
-            print(i)
-            level_below = fred.get_child_categories(i)
-            try:
-                level_below_list = [d['id'] for d in level_below['categories']]
-            except:
-                level_below_list = []
-
-            print(level_below['categories'])
-
-            
-            if (len(level_below_list) == 0) or (level_below is None):
-                print("No child categories for category ID ",i, "checking for series")
-                series = fred.get_series_in_a_category(i,limit=1000)
-                if len(series['seriess']) > 0:
-                    print("There are series to add:")
-                    try:
-                        full_series_list.set(full_series_list() + series['seriess'])
-                    except:
-                        pass
-                else:
-                    pass
-            else:
-                for k in level_below_list:
-                    print(k)
-                    level_2 = fred.get_child_categories(k)
-                    try:
-                        level_2_list = [d['id'] for d in level_2['categories']]
-                    except:
-                        level_2_list = []
-                    print(level_2['categories'])
-                    if (len(level_2_list) == 0) or (level_2 is None):
-                        print("series at level 3")
-                        series = fred.get_series_in_a_category(k,limit=1000)
-                        try:
-                            full_series_list.set(full_series_list() + series['seriess'])
-                        except:
-                            pass
-                        print("pausing for 5 seconds")
-                        time.sleep(5)
-                        print('Resumed at', time.ctime())
-                    else:
-                        for j in level_2_list:
-                            level_3 = fred.get_child_categories(j)
-                            try:
-                                level_3_list = [d['id'] for d in level_3['categories']]
-                            except:
-                                level_3_list = []
-
-                            if (len(level_3_list) == 0) or (level_3 is None):
-                                print("series at level 4")
-                                series = fred.get_series_in_a_category(j,limit = 1000)
-                                try:
-                                    full_series_list.set(full_series_list() + series['seriess'])
-                                except:
-                                    pass
-                                print("pausing for 5 seconds")
-                                time.sleep(5)
-                                print('Resumed at', time.ctime())
-                            else:
-                                for l in level_3['categories']:
-                                    level_4 = fred.get_child_categories(l)
-                                    try:
-                                        level_4_list = [d['id'] for d in level_4['categories']]
-                                    except:
-                                        level_4_list = []
-
-                                    if (len(level_4_list) == 0) or (level_4 is None):
-                                        print("series at level 5")
-                                        series = fred.get_series_in_a_category(l,limit = 1000)
-                                        try:
-                                            full_series_list.set(full_series_list() + series['seriess'])
-                                        except:
-                                            pass
-                                        print("pausing for 5 seconds")
-                                        time.sleep(5)
-                                        print('Resumed at', time.ctime())
-                                    else:
-                                        pass    
 
+        # the selection is resolved to leaf categories from the local index,
+        # and their series are read from the local catalog. only categories
+        # missing from the catalog (or stale, if asked) go to the API
+        leaves = category_index.leaf_categories(series_search_list())
+        max_age = DEFAULT_MAX_AGE_DAYS if input.refresh_catalog() else None
+        live = series_catalog.stale_categories(leaves, max_age)
+        live_set = set(live)
+        cached = series_catalog.series_for([c for c in dict.fromkeys(leaves) if c not in live_set])
+        metrics.inc('cache_hits_total', len(leaves) - len(live), cache='series_catalog')
+        metrics.inc('cache_misses_total', len(live), cache='series_catalog')
+        discovered = cached.to_dict('records')
+        print(len(leaves) - len(live), "categories read from the catalog,", len(live), "fetched from FRED")
+
+        future = background_pool.submit(
+            refresh_categories,
+            series_catalog,
+            live,
+            lambda: Fred('api_key.txt'),
+            lambda category_id, page: discovered.extend(page),
+            lambda i: category_index.children.get(i, []),
+            fred_bucket
+        )
+        if len(live) > 0:
+            future.add_done_callback(lambda f: series_catalog.save() if f.exception() is None else None)
+        crawl_job.set({'future': future, 'series': discovered, 'published': 0, 'label': "FRED category search"})
 
-            
-            print("Child categories or series for ",i, ' are gathered. Pausing for 5 seconds', time.ctime())
-            time.sleep(5)
-            print('Resumed at', time.ctime())
-        full_series_list.set([pd.DataFrame(full_series_list()).drop_duplicates()])
+    ### poll the running crawl or scrape and publish whatever series it has found so far ###
+    @reactive.Effect
+    def stream_crawled_series():
+        job = crawl_job()
+        if job is None:
+            return
+        future = job['future']
+        done = future.done()
+        found = len(job['series'])
+        if found > job['published']:
+            full_series_list.set([pd.DataFrame(job['series'][:found]).drop_duplicates()])
+            job['published'] = found
+
+        if done:
+            crawl_job.set(None)
+            if future.exception() is not None:
+                print(future.exception())
+                ui.notification_show("The " + job['label'] + " failed: " + str(future.exception()), type="error", duration=15)
+            else:
+                print("The " + job['label'] + " finished", time.ctime())
+        else:
+            reactive.invalidate_later(1)
 
     ### create output table of the full series #####
     ### this is used no matter the source of the series ####
@@ -410,11 +421,13 @@ def server(input: Inputs, output: Outputs, session: Session):
     
     ### prepare download button to download series ID data ####
     
-    @session.download(filename="series.csv")
+    @session.download(filename=lambda: exports.filename("series", input.series_format()),
+                      media_type=lambda: exports.media_type(input.series_format()))
     def series_download():
         req(full_series_list())
         #df = pd.DataFrame(full_series_list())
-        yield full_series_list()[0].to_csv(index=False)
+        ### streamed a chunk of rows at a time ###
+        yield from exports.stream_frame(full_series_list()[0], input.series_format())
     
     ## create UI section around series output table #####
     @output
@@ -425,7 +438,10 @@ def server(input: Inputs, output: Outputs, session: Session):
 
         return ui.TagList(
                 ui.tags.h4("Series Dataset"),
-                ui.download_button("series_download", "Download Series CSV"),
+                ui.row(
+                    ui.column(3, ui.input_select("series_format", "Download format", exports.EXPORT_CHOICES)),
+                    ui.column(3, ui.download_button("series_download", "Download Series"))
+                ),
                 ui.output_data_frame("series_table")
         )
     
@@ -440,13 +456,14 @@ def server(input: Inputs, output: Outputs, session: Session):
     
     results_df = reactive.Value([])
 
-    ## big code chunk containing analysis logic ####
-    ## essentially: 1) loop through baseline files ###
-    ##              2) loop through series IDs
-    ##              3) for each series ID, fetch series data from FRED
-    ##              4) calculate spearman and pearson correlation between 
-    ##                  baseline and series data, at all lags
-    ##              5) store results
+    ## the analysis itself lives in pipeline.run_analysis. On button click it is ####
+    ## started as a background job, so the session stays responsive while it runs ###
+    analysis_job = reactive.Value(None)
+
+    ### aligned series and correlations from earlier runs in this session, so a ####
+    ### rerun with a new lag or percent change doesn't fetch and align again #######
+    panel_cache = PanelCache()
+
     @reactive.Effect
     @reactive.event(input.analysis_begin)
     def core_analysis():
@@ -454,157 +471,218 @@ def server(input: Inputs, output: Outputs, session: Session):
         req(full_series_list())
 
         from full_fred.fred import Fred
-        from datetime import datetime
-        import time
-        import numpy as np
-        from scipy.stats import pearsonr, spearmanr
-
-        fred = Fred('api_key.txt')
-        fred.get_api_key_file()
-        import warnings
-
-
-        output_dict = {}
-
-        for key in baseline_df_list()[0]:
-            print(key)
-            base_data = baseline_df_list()[0][key]
-            base_data['Date'] = pd.to_datetime(base_data['Date'],yearfirst=True).dt.date
-            OBSERVATION_START = base_data['Date'].min()
-            OBSERVATION_END = base_data['Date'].max()
-            output_dict[key] = {}
-            count = 0
-
-            for code in full_series_list()[0][full_series_list()[0].columns[0]]:
-                print(code)
-                if input.pcnt_change != 0:
-                    indicators = fred.get_series_df(code,observation_start = OBSERVATION_START, observation_end = OBSERVATION_END)
-                    if indicators.shape[1] > 0:
-                        indicators = indicators.drop(['realtime_start','realtime_end'], axis=1)
-                        indicators['value'] = pd.to_numeric(indicators['value'],errors='coerce')
-                        indicators['value'] = indicators['value'].pct_change(input.pct_change()).replace([np.inf, -np.inf], [0, 0]).fillna(0)*100
-                    else:
-                        pass
-                else:
-                    indicators = fred.get_series_df(code,observation_start = OBSERVATION_START, observation_end = OBSERVATION_END)
-                    print(indicators.head())
-                    if indicators.shape[1] > 0:
-                        indicators = indicators.drop(['realtime_start','realtime_end'], axis=1)
-                        indicators['value'] = pd.to_numeric(indicators['value'],errors='coerce')
-                    else:
-                        pass
-
-                if base_data.shape[0] > indicators.shape[0]:
-                    base_data = base_data[0:indicators.shape[0]]
-                elif indicators.shape[0] > base_data.shape[0]:
-                    indicators = indicators[0:base_data.shape[0]]
-                else:
-                    pass
-
-                if base_data.shape[0] < 15:
-                    print("Insufficent data in this range")
-                else:
-                    indicators['date'] = pd.to_datetime(indicators['date'],yearfirst=True).dt.date
-                    joined_data = pd.merge(base_data,indicators,left_on = "Date",right_on = "date", how = "inner")
-
-                    joined_rows = joined_data.shape[0]
-
-                    if joined_rows < 15:
-                        print("Insufficent data in this range")
-                    else:
-                        output_dict[key][code] = {}
-                        output_dict[key][code]['lag'] = [0]
-
-                        
-                        try:
-                            pcorr = pearsonr(joined_data.iloc[:,1],joined_data.iloc[:,3])
-                            scorr = spearmanr(joined_data.iloc[:,1],joined_data.iloc[:,3])
-                            print(pcorr)
-                            print(scorr)
-                            output_dict[key][code]['pearsoncorr'] = [pcorr[0]]
-                            output_dict[key][code]['pearson_pval'] = [pcorr[1]]
-                            output_dict[key][code]['spearmancorr'] = [scorr[0]]
-                            output_dict[key][code]['spearman_pval'] = [scorr[1]]
-                        except:
-                            output_dict[key][code]['pearsoncorr'] = [0]
-                            output_dict[key][code]['pearson_pval'] = [0]
-                            output_dict[key][code]['spearmancorr'] = [0]
-                            output_dict[key][code]['spearman_pval'] = [0]
-
-                        for i in range(1,input.lag()+1):
-                            output_dict[key][code]['lag'].append(i)
-
-                            try:
-                                pcorr = pearsonr(joined_data.iloc[i:joined_rows,1],joined_data.iloc[0:joined_rows-i,3])
-                                scorr = spearmanr(joined_data.iloc[i:joined_rows,1],joined_data.iloc[0:joined_rows-i,3])
-                                print(pcorr)
-                                print(scorr)
-                                output_dict[key][code]['pearsoncorr'].append(pcorr[0])
-                                output_dict[key][code]['pearson_pval'].append(pcorr[1])
-                                output_dict[key][code]['spearmancorr'].append(scorr[0])
-                                output_dict[key][code]['spearman_pval'].append(scorr[1])
-
-                            except:
-                                output_dict[key][code]['pearsoncorr'].append(0)
-                                output_dict[key][code]['pearson_pval'].append(0)
-                                output_dict[key][code]['spearmancorr'].append(0)
-                                output_dict[key][code]['spearman_pval'].append(0)
-
-                base_data = baseline_df_list()[0][key]
-                count += 1
-                if count % 100 == 0:
-                    print(count, 'data sets pulled, waiting 45 seconds to resume at', time.ctime())
-                    time.sleep(45)
-                    print('Resumed at', time.ctime())
-
-        output_frame = pd.DataFrame()
-        for key in output_dict:
-            code_dict = output_dict[key]
-            for code in code_dict:
-                df = pd.DataFrame.from_dict(code_dict[code])
-
-                row_count = df.shape[0]
-                df['baseline_data'] = np.repeat(key, row_count)
-                df['indicator_code'] = np.repeat(code,row_count)
-                output_frame = pd.concat([output_frame,df])
-
-
-        results_df.set([output_frame])
+        from jobs import Job
+        from pipeline import run_analysis
+        from run_journal import RunJournal
+
+        if analysis_job() is not None:
+            ui.notification_show("An analysis is already running. Cancel it before starting another.", type="warning", duration=10)
+            return
+
+        baselines = dict(baseline_df_list()[0])
+        codes = full_series_list()[0][full_series_list()[0].columns[0]].tolist()
+        screen = input.screen_bound() if input.screen() else None
+        rolling = (input.rolling_window(), input.rolling_threshold()) if input.rolling() else None
+        dedup = input.dedup_threshold() if input.dedup() else None
+        ### finished pairs are journaled to disk, so an interrupted run can pick up where it left off ###
+        journal = RunJournal.for_run(baselines, codes, input.lag(), input.pct_change(), input.aggregation(), screen,
+                                     resume=input.resume_run(), rolling=rolling, dedup=dedup)
+        results_df.set([])
+        job = Job(total=len(codes))
+        job.future = background_pool.submit(
+            run_analysis,
+            baselines,
+            codes,
+            input.lag(),
+            input.pct_change(),
+            shared_observations,
+            Fred('api_key.txt'),
+            job,
+            aggregation=input.aggregation(),
+            throttle_calls=None,
+            screen=screen,
+            cache=panel_cache,
+            journal=journal,
+            rolling=rolling,
+            dedup=dedup
+        )
+        analysis_job.set(job)
+
+    @reactive.Effect
+    @reactive.event(input.analysis_cancel)
+    def cancel_analysis():
+        job = analysis_job()
+        if job is not None:
+            job.cancel()
+
+    ### poll the running job: redraw the progress bar, and once it has finished ###
+    ### push the results into results_df ########################################
+    analysis_tick = reactive.Value(0)
+
+    @reactive.Effect
+    def watch_analysis():
+        from jobs import JobCancelled
+
+        job = analysis_job()
+        if job is None:
+            return
+        done = job.future.done()
+        ### append any batches finished since the last poll to the results ###
+        with reactive.isolate():
+            published = len(results_df()) if results_df() else 0
+        if len(job.results) > published:
+            with reactive.isolate():
+                results_df.set(results_df() + job.results[published:])
+
+        if not done:
+            with reactive.isolate():
+                analysis_tick.set(analysis_tick() + 1)
+            reactive.invalidate_later(1)
+            return
+
+        analysis_job.set(None)
+        try:
+            results_df.set([job.future.result()])
+        except JobCancelled:
+            ui.notification_show("Analysis cancelled", duration=10)
+        except Exception as e:
+            print(e)
+            ui.notification_show("The analysis failed: " + str(e), type="error", duration=15)
+
+    @output
+    @render.ui
+    def analysis_progress():
+        req(analysis_job())
+
+        return ui.TagList(
+                ui.output_ui("analysis_status"),
+                ui.input_action_button("analysis_cancel", "Cancel", class_="btn-danger")
+        )
+
+    @output
+    @render.ui
+    def analysis_status():
+        analysis_tick()
+        job = analysis_job()
+        req(job)
+
+        percent = 100 * job.done / job.total if job.total > 0 else 0
+        eta = job.eta()
+        status = str(job.done) + " of " + str(job.total) + " series done, " + str(job.api_calls) + " API calls made"
+        if job.cancelled:
+            status = "Cancelling..."
+        elif eta is not None:
+            status += ", about " + str(int(eta // 60)) + " min " + str(int(eta % 60)) + " s left"
+
+        return ui.TagList(
+                ui.tags.div(
+                    ui.tags.div(class_="progress-bar", role="progressbar", style="width: " + str(round(percent, 1)) + "%"),
+                    class_="progress"
+                ),
+                ui.tags.p(status)
+        )
+
+    ### results_df holds the results as a list of frames, one per finished batch. ####
+    ### they are indexed once when they change, so moving a threshold slider is ####
+    ### a binary search, and only the current page is sent to the browser #########
+    @reactive.Calc
+    def results_index():
+        from results_store import ResultIndex
+
+        req(results_df())
+        return ResultIndex(pd.concat(results_df(), ignore_index=True))
+
+    @reactive.Calc
+    def matching_results():
+        return results_index().matching(input.pearson_thresh(), input.spearman_thresh())
+
+    results_page = reactive.Value(0)
+
+    def page_count():
+        return max(1, -(-len(matching_results()[0]) // int(input.results_page_size())))
+
+    ### a new filter or ordering starts again from the first page ###
+    @reactive.Effect
+    @reactive.event(input.pearson_thresh, input.spearman_thresh, input.results_sort, input.results_descending, input.results_page_size)
+    def _():
+        results_page.set(0)
+
+    @reactive.Effect
+    @reactive.event(input.results_prev)
+    def _():
+        results_page.set(max(0, results_page() - 1))
+
+    @reactive.Effect
+    @reactive.event(input.results_next)
+    def _():
+        results_page.set(min(page_count() - 1, results_page() + 1))
+
+    @output
+    @render.text
+    def results_page_label():
+        page = min(results_page(), page_count() - 1)
+        return ("Page " + str(page + 1) + " of " + str(page_count()) + ", " + str(len(matching_results()[0])) +
+                " of " + str(len(results_index())) + " rows above the thresholds")
 
     ### prepare output results table ###   
     @output
     @render.data_frame
-    @reactive.event(results_df,input.pearson_thresh, input.spearman_thresh)
     def results_table():
-        df = results_df()[0]
-        df = df[(df['pearsoncorr'].abs() >= input.pearson_thresh()) & (df['spearmancorr'].abs() >= input.spearman_thresh())]
+        page = min(results_page(), page_count() - 1)
         return render.DataTable(
-                df,
+                results_index().page(matching_results(), input.results_sort(), input.results_descending(),
+                                     page, int(input.results_page_size())),
                 height=500,
                 width="100%",
                 filters = False
         )
 
     ## create UI components for results section ###
+    ## it is only drawn once, when the first results arrive, so batches ##
+    ## streaming in during a run only redraw the table itself ############
+    results_ready = reactive.Value(False)
+
+    @reactive.Effect
+    def _():
+        results_ready.set(len(results_df()) > 0)
+
     @output
     @render.ui
-    @reactive.event(results_df)
+    @reactive.event(results_ready)
     def results_table_section():
-        req(results_df())
+        req(results_ready())
+        ### rolling-window columns are only offered when the results have them ###
+        with reactive.isolate():
+            columns = results_index().frame.columns
+        sort_choices = {column: label for column, label in RESULT_SORT_CHOICES.items() if column in columns}
 
         return ui.TagList(
                 ui.tags.h4("Results Table"),
-                ui.download_button("results_download", "Download Results"),
-                ui.output_data_frame("results_table")
+                ui.row(
+                    ui.column(3, ui.input_select("results_format", "Download format", exports.EXPORT_CHOICES)),
+                    ui.column(3, ui.download_button("results_download", "Download Results"))
+                ),
+                ui.row(
+                    ui.column(4, ui.input_select("results_sort", "Sort by", sort_choices)),
+                    ui.column(3, ui.input_checkbox("results_descending", "Descending", value=True)),
+                    ui.column(3, ui.input_select("results_page_size", "Rows per page", ["25", "50", "100", "500"], selected="100"))
+                ),
+                ui.output_data_frame("results_table"),
+                ui.row(
+                    ui.column(2, ui.input_action_button("results_prev", "Previous")),
+                    ui.column(8, ui.output_text("results_page_label")),
+                    ui.column(2, ui.input_action_button("results_next", "Next"))
+                )
         )
     
     ## create download handler to download results data
-    @session.download(filename="results.csv")
+    @session.download(filename=lambda: exports.filename("results", input.results_format()),
+                      media_type=lambda: exports.media_type(input.results_format()))
     def results_download():
         req(results_df())
-        df = results_df()[0]
-        df = df[(df['pearsoncorr'].abs() >= input.pearson_thresh()) & (df['spearmancorr'].abs() >= input.spearman_thresh())]
-        yield df.to_csv(index=False)
+        ### the matching rows are read straight out of the results a chunk at a time ###
+        index = results_index()
+        yield from exports.stream_frame(index.frame, input.results_format(), rows=index.rows(matching_results()))
 
     ## notification to tell user Web scrape has started #####
     @reactive.Effect
@@ -613,39 +691,19 @@ def server(input: Inputs, output: Outputs, session: Session):
         ui.notification_show("Scraping FRED URL.  This may take a while", duration=15)
 
     ## server logic to perform web scrape
+    ## pages are scraped on a background thread and the series found are
+    ## streamed into full_series_list the same way as the category search
     @reactive.Effect
     @reactive.event(input.web_scrape_begin)
     def web_scrape():
-        
-        import httplib2
-        from bs4 import BeautifulSoup, SoupStrainer
-        import re
-
-        codes = []
-        names = []
-        print(type(codes))
-        print(type(names))
-        print(input.scrape_url())
+        from scraper import scrape_series
+
         url = input.scrape_url()
         print("Scraping URL: " + url)
-        http = httplib2.Http()
-        status, response = http.request(url)
-        soup = BeautifulSoup(response, "html.parser")
-        max_pages = int(soup.find("a", title=re.compile("last page"))['href'].split('=')[-1])
-
-        for i in range(max_pages):
-            print("page " + str(i))
-            http = httplib2.Http()
-            status, response = http.request(url+'&pageID='+str(i))
-            soup = BeautifulSoup(response, "html.parser")
-            for link in soup.find_all("a", href=re.compile("series/")):
-                codes.append(link['href'].split('/')[-1])
-                names.append(link.text.strip())
-
-        codes = pd.DataFrame(list(set(list(zip(codes, names)))), columns = ['Codes', 'Names'])
-        codes = codes[codes['Names'] != ''].drop_duplicates(subset='Codes')
-        print(codes)
-        full_series_list.set([codes])
+        full_series_list.set([])
+        discovered = []
+        future = background_pool.submit(scrape_series, url, discovered.extend)
+        crawl_job.set({'future': future, 'series': discovered, 'published': 0, 'label': "FRED web scrape"})
 
     ## server logic to handle uploaded series IDs for analysis
     @reactive.Effect
@@ -655,4 +713,34 @@ def server(input: Inputs, output: Outputs, session: Session):
         full_series_list.set([df])
 
 
-app = App(app_ui, server)
+    ## diagnostics table, refreshed every few seconds
+    @output
+    @render.data_frame
+    def diagnostics_table():
+        import metrics
+
+        reactive.invalidate_later(3)
+        return render.DataTable(metrics.snapshot(), width="100%", filters=False)
+
+
+    @output
+    @render.data_frame
+    def startup_table():
+        reactive.invalidate_later(3)
+        return render.DataTable(warmup.report(), width="100%", filters=False)
+
+
+def metrics_endpoint(request):
+    import metrics
+    from starlette.responses import PlainTextResponse
+
+    return PlainTextResponse(metrics.prometheus_text(), media_type="text/plain; version=0.0.4")
+
+
+### the shiny app is mounted under a small starlette app that also serves /metrics ###
+shiny_app = App(app_ui, server)
+app = Starlette(routes=[Route("/metrics", metrics_endpoint), Mount("/", app=shiny_app)])
+
+### the app can serve requests from here; the handlers' heavy imports load in the background ###
+warmup.record("app ready", time.perf_counter() - warmup.STARTED)
+warmup.warm_imports()
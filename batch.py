@@ -0,0 +1,98 @@
+############ headless batch runner for the correlation pipeline ################################
+############ runs the same fetch -> align -> lag-correlation pipeline as the app, without a ######
+############ browser. the series list is split into one shard per worker process and the ##########
+############ combined results are written to parquet. for example:
+############
+############     python -m batch --baseline gdp.csv cpi.csv --series series.csv --lag 8 \
+############         --workers 4 --output results.parquet
+
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from alignment import AGGREGATIONS
+from category_crawler import FRED_REQUESTS_PER_MINUTE, TokenBucket
+from ingest import parse_baseline
+from observation_store import ObservationStore, DEFAULT_PATH
+from pipeline import result_accumulator, run_analysis
+from run_journal import RunJournal
+
+
+### runs in a worker process: every worker has its own FRED client and store connection ###
+def _run_shard(baselines, codes, lag, pct_change, aggregation, cache_path, requests_per_minute, screen, resume, rolling, dedup):
+    from full_fred.fred import Fred
+
+    store = ObservationStore(cache_path, bucket=TokenBucket(requests_per_minute / 60, capacity=1))
+    ### each shard journals its own series, so a rerun with the same workers resumes every shard ###
+    journal = RunJournal.for_run(baselines, codes, lag, pct_change, aggregation, screen, resume, rolling=rolling, dedup=dedup)
+    return run_analysis(baselines, codes, lag, pct_change, store, Fred('api_key.txt'),
+                        aggregation=aggregation, throttle_calls=None, screen=screen, journal=journal,
+                        rolling=rolling, dedup=dedup)
+
+
+def run_batch(baselines, codes, lag=5, pct_change=1, aggregation='mean', workers=None, cache_path=DEFAULT_PATH, screen=None,
+              resume=False, rolling=None, dedup=None):
+    ### baselines maps file name -> frame, codes is the list of FRED series IDs. ####
+    ### duplicates are grouped within each worker's shard of series ################
+    workers = workers or os.cpu_count() or 1
+    shards = [list(shard) for shard in np.array_split(np.array(codes, dtype=object), workers) if len(shard) > 0]
+    ### the workers share one API key, so each gets an equal slice of its quota ###
+    requests_per_minute = FRED_REQUESTS_PER_MINUTE / max(1, len(shards))
+
+    if len(shards) == 0:
+        ### nothing to run: the same columns as a run, with no rows ###
+        frames = [result_accumulator(rolling, dedup).to_frame()]
+    else:
+        with ProcessPoolExecutor(max_workers=len(shards)) as pool:
+            futures = [pool.submit(_run_shard, baselines, shard, lag, pct_change, aggregation, cache_path, requests_per_minute, screen,
+                                   resume, rolling, dedup)
+                       for shard in shards]
+            frames = [f.result() for f in futures]
+
+    results = pd.concat(frames, ignore_index=True)
+    ### shards come back baseline by baseline; put them back in baseline, then series order ###
+    baseline_order = {name: i for i, name in enumerate(baselines)}
+    results = results.iloc[np.argsort(results['baseline_data'].map(baseline_order).to_numpy(), kind='stable')]
+    results['baseline_data'] = pd.Categorical(results['baseline_data'], categories=list(baselines))
+    results['indicator_code'] = results['indicator_code'].astype('category')
+    if 'duplicate_of' in results:
+        results['duplicate_of'] = results['duplicate_of'].astype('category')
+    return results.reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the FRED correlation screen without the Shiny app.")
+    parser.add_argument("--baseline", nargs="+", required=True, help="baseline CSV files (Date, value)")
+    parser.add_argument("--series", required=True, help="CSV whose first column holds FRED series IDs")
+    parser.add_argument("--lag", type=int, default=5, help="number of lagging periods applied to the baseline")
+    parser.add_argument("--pct-change", type=int, default=1, help="interval for percent change, 0 for raw values")
+    parser.add_argument("--aggregation", choices=list(AGGREGATIONS), default="mean",
+                        help="how series more frequent than the baseline are converted to its frequency")
+    parser.add_argument("--screen", type=float, default=None,
+                        help="only keep series whose |pearson| reaches this at some lag, skipping spearman for the rest")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes, one shard of series each")
+    parser.add_argument("--cache", default=DEFAULT_PATH, help="observation store to read and fill")
+    parser.add_argument("--window", type=int, default=None,
+                        help="also summarize correlations over rolling windows of this many periods")
+    parser.add_argument("--window-threshold", type=float, default=0.65,
+                        help="|correlation| a window must reach to count towards the window fractions")
+    parser.add_argument("--dedup", type=float, default=None,
+                        help="group series that correlate at least this closely and correlate one per group")
+    parser.add_argument("--resume", action="store_true",
+                        help="skip series finished by an interrupted run with the same inputs and --workers")
+    parser.add_argument("--output", default="results.parquet", help="parquet file to write")
+    args = parser.parse_args()
+
+    baselines = {os.path.basename(path): parse_baseline(path) for path in args.baseline}
+    series = pd.read_csv(args.series)
+    codes = series[series.columns[0]].tolist()
+
+    print("Screening", len(codes), "series against", len(baselines), "baselines", time.ctime())
+    results = run_batch(baselines, codes, args.lag, args.pct_change, args.aggregation, args.workers, args.cache, args.screen,
+                        args.resume, (args.window, args.window_threshold) if args.window else None, args.dedup)
+    results.to_parquet(args.output, index=False)
+    print("Wrote", results.shape[0], "rows to", args.output, time.ctime())
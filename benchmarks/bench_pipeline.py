@@ -0,0 +1,123 @@
+############ benchmark suite for the analysis pipeline #########################################
+############ times each stage (crawl, scrape, fetch, align, dedup, correlate, screen, rolling, ####
+############ assemble, render) against the local FRED stand-in at several scales, so throughput ###
+############ can be compared from release to release. run from the repository root:
+############
+############     python -m benchmarks.bench_pipeline --scales 100 1000 10000 --json bench.json
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from alignment import align_series, baseline_periods
+from category_crawler import crawl_categories, TokenBucket
+from dedup import DuplicateGroups
+from observation_store import ObservationStore
+from pipeline import correlate_panel, run_analysis
+from results_store import ResultAccumulator
+from scraper import scrape_series
+
+from benchmarks.fake_fred import FakeFetcher, FakeFred, FakeService
+
+### rolling stage window, in baseline periods ###
+ROLLING_WINDOW = 20
+
+STAGES = ['crawl', 'scrape', 'fetch_cold', 'fetch_warm', 'align', 'dedup', 'correlate', 'screen', 'rolling', 'assemble', 'render',
+          'pipeline']
+
+
+def _timed(timings, stage, fn, *args, **kwargs):
+    started = time.perf_counter()
+    result = fn(*args, **kwargs)
+    timings[stage] = time.perf_counter() - started
+    return result
+
+
+def _render(frame):
+    ### what render.DataTable ships to the browser ###
+    try:
+        from shiny.render._dataframe import serialize_pandas_df
+        return serialize_pandas_df(frame)
+    except ImportError:
+        return frame.to_json(orient='split')
+
+
+def bench_scale(n_series, lag=5, latency=0.0, requests_per_minute=None, workers=8, screen=0.5):
+    service = FakeService(n_series=n_series, latency=latency, requests_per_minute=requests_per_minute)
+    fred = FakeFred(service)
+    timings = {}
+
+    dates = pd.date_range('2000-01-01', '2020-10-01', freq='QS')
+    baseline = pd.DataFrame({'Date': dates.strftime('%Y-%m-%d'),
+                             'value': np.random.default_rng(1).normal(size=dates.shape[0])})
+    freq, base = baseline_periods(baseline)
+    start, end = base.index[0].start_time.date(), base.index[-1].end_time.date()
+
+    ### with a quota, the crawl and the fetches share one bucket, kept just under it ###
+    ### since timer jitter could otherwise tip a minute one request over ###############
+    bucket = TokenBucket(requests_per_minute * 0.99 / 60, capacity=1) if requests_per_minute is not None else None
+
+    found = []
+    _timed(timings, 'crawl', crawl_categories, [0], lambda category_id, page: found.extend(page),
+           lambda: FakeFred(service), workers=workers, requests_per_minute=10 ** 9, bucket=bucket)
+    scraped = []
+    _timed(timings, 'scrape', scrape_series, 'https://fred.stlouisfed.org/searchresults?st=fake', scraped.extend,
+           workers=workers, fetcher=FakeFetcher(service))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = ObservationStore(os.path.join(tmp, 'bench.sqlite'), bucket=bucket)
+        codes = service.series_ids
+
+        def fetch_all():
+            return {code: store.get_series_df(fred, code, start, end) for code in codes}
+
+        _timed(timings, 'fetch_cold', fetch_all)
+        frames = _timed(timings, 'fetch_warm', fetch_all)
+
+        panel = _timed(timings, 'align', lambda: align_series(frames, freq, 'mean', 1).reindex(base.index))
+        _timed(timings, 'dedup', DuplicateGroups().assign, panel)
+        kept, stats = _timed(timings, 'correlate', correlate_panel, base.to_numpy(), panel, lag)
+        _timed(timings, 'screen', correlate_panel, base.to_numpy(), panel, lag, screen)
+        _timed(timings, 'rolling', correlate_panel, base.to_numpy(), panel, lag, rolling=(ROLLING_WINDOW, 0.65))
+
+        def assemble():
+            results = ResultAccumulator()
+            results.append_block('baseline.csv', kept, stats)
+            return results.to_frame()
+
+        results = _timed(timings, 'assemble', assemble)
+        _timed(timings, 'render', _render, results)
+
+        _timed(timings, 'pipeline', run_analysis, {'baseline.csv': baseline}, codes, lag, 1, store, fred,
+               throttle_calls=10 ** 9)
+
+    assert len(found) == n_series and len(scraped) == n_series
+    return timings
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time each pipeline stage against a local FRED stand-in.")
+    parser.add_argument("--scales", type=int, nargs="+", default=[100, 1000, 10000], help="numbers of series to run")
+    parser.add_argument("--lag", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every fake API request")
+    parser.add_argument("--requests-per-minute", type=int, default=None,
+                        help="make the stand-in enforce this API quota, and keep the benchmark under it")
+    parser.add_argument("--screen", type=float, default=0.5, help="pearson bound for the screening stage")
+    parser.add_argument("--json", default=None, help="also write the timings to this file")
+    args = parser.parse_args()
+
+    report = {}
+    print("series".rjust(8) + "".join(stage.rjust(12) for stage in STAGES))
+    for n in args.scales:
+        timings = bench_scale(n, args.lag, args.latency, args.requests_per_minute, screen=args.screen)
+        report[n] = timings
+        print(str(n).rjust(8) + "".join(("%.3f" % timings[stage]).rjust(12) for stage in STAGES))
+
+    if args.json is not None:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
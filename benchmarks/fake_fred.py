@@ -0,0 +1,138 @@
+############ local stand-in for the FRED API ##################################################
+############ generates a synthetic category tree, series listings and observations at any scale, ##
+############ with optional per-request latency and a per-minute request quota, so the pipeline ####
+############ can be timed without touching the live API. FakeFred answers the same calls the #####
+############ app makes on full_fred's Fred client, and FakeFetcher serves listing pages to the ####
+############ web scraper #########################################################################
+
+import threading
+import time
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+
+### FRED frequency codes -> pandas date_range aliases, dated the way FRED dates them ###
+FREQUENCY_ALIASES = {'D': 'B', 'W': 'W-FRI', 'BW': '2W-WED', 'M': 'MS', 'Q': 'QS', 'SA': '6MS', 'A': 'AS'}
+
+
+class FakeRateLimitError(Exception):
+    pass
+
+
+class FakeService:
+
+    def __init__(self, n_series=1000, branching=4, depth=3, frequencies=('M', 'Q'),
+                 start='1990-01-01', end='2023-12-31', latency=0.0, requests_per_minute=None, seed=0):
+        self.latency = latency
+        self.requests_per_minute = requests_per_minute
+        self.start, self.end = pd.Timestamp(start), pd.Timestamp(end)
+        self.seed = seed
+        self.calls = 0
+        self._recent = deque()
+        self._lock = threading.Lock()
+
+        ### category tree: ids count up breadth first from the root's children ###
+        self.children = {0: []}
+        level = [0]
+        next_id = 1
+        for _ in range(depth):
+            below = []
+            for parent in level:
+                self.children[parent] = list(range(next_id, next_id + branching))
+                below.extend(self.children[parent])
+                next_id += branching
+            level = below
+        self.leaves = level
+        for leaf in self.leaves:
+            self.children[leaf] = []
+        self.names = {i: "Category " + str(i) for i in self.children if i != 0}
+        self.parent = {kid: parent for parent, kids in self.children.items() for kid in kids}
+
+        ### series are dealt round robin over the leaves ###
+        self.series_ids = ["FAKE" + str(i).zfill(6) for i in range(n_series)]
+        self.position = {s: i for i, s in enumerate(self.series_ids)}
+        self.frequency = {s: frequencies[i % len(frequencies)] for i, s in enumerate(self.series_ids)}
+        self.series_in = {leaf: [] for leaf in self.leaves}
+        for i, s in enumerate(self.series_ids):
+            self.series_in[self.leaves[i % len(self.leaves)]].append(s)
+
+    ### every request pays the latency; API requests also count against the quota ###
+    def request(self, api=True):
+        with self._lock:
+            now = time.monotonic()
+            self.calls += 1
+            if api and self.requests_per_minute is not None:
+                while self._recent and now - self._recent[0] > 60:
+                    self._recent.popleft()
+                if len(self._recent) >= self.requests_per_minute:
+                    raise FakeRateLimitError("Too Many Requests. Exceeded Rate Limit")
+                self._recent.append(now)
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+    def categories_frame(self):
+        ids = sorted(self.parent)
+        return pd.DataFrame({'id': ids, 'name': [self.names[i] for i in ids], 'parent_id': [self.parent[i] for i in ids]})
+
+    def observations(self, series_id, observation_start=None, observation_end=None):
+        freq = FREQUENCY_ALIASES[self.frequency[series_id]]
+        dates = pd.date_range(self.start, self.end, freq=freq)
+        rng = np.random.default_rng([self.seed, self.position[series_id]])
+        values = np.cumsum(rng.normal(size=dates.shape[0])) + 100
+        keep = np.ones(dates.shape[0], dtype=bool)
+        if observation_start is not None:
+            keep &= dates >= pd.Timestamp(observation_start)
+        if observation_end is not None:
+            keep &= dates <= pd.Timestamp(observation_end)
+        return dates[keep], values[keep]
+
+
+class FakeFred:
+
+    def __init__(self, service):
+        self.service = service
+
+    def get_child_categories(self, category_id):
+        self.service.request()
+        return {'categories': [{'id': i, 'name': self.service.names[i], 'parent_id': category_id}
+                               for i in self.service.children.get(category_id, [])]}
+
+    def get_series_in_a_category(self, category_id, limit=1000, offset=0):
+        self.service.request()
+        series = self.service.series_in.get(category_id, [])
+        page = series[offset:offset + limit]
+        return {'count': len(series), 'offset': offset, 'limit': limit,
+                'seriess': [{'id': s, 'title': "Fake series " + s, 'frequency_short': self.service.frequency[s]} for s in page]}
+
+    def get_series_df(self, series_id, observation_start=None, observation_end=None):
+        self.service.request()
+        dates, values = self.service.observations(series_id, observation_start, observation_end)
+        date_strings = dates.strftime('%Y-%m-%d')
+        return pd.DataFrame({
+            'realtime_start': '2024-01-01',
+            'realtime_end': '2024-01-01',
+            'date': date_strings,
+            'value': np.char.mod('%.4f', values),
+        })
+
+
+class FakeFetcher:
+    ### serves FRED style listing pages, PAGE_SIZE series per page, to scrape_series ###
+    PAGE_SIZE = 40
+
+    def __init__(self, service):
+        self.service = service
+        self.pages = max(1, -(-len(service.series_ids) // self.PAGE_SIZE))
+
+    def get(self, url):
+        ### listing pages are the website, not the API, so they don't use up the quota ###
+        self.service.request(api=False)
+        page = int(url.split('pageID=')[-1]) if 'pageID=' in url else 1
+        series = self.service.series_ids[(page - 1) * self.PAGE_SIZE:page * self.PAGE_SIZE]
+        links = "".join('<tr><td><a href="/series/' + s + '"><img/></a></td><td><a href="/series/' + s + '">Fake series ' + s + '</a></td></tr>'
+                        for s in series)
+        return ("<html><body><table>" + links + "</table>"
+                '<a title="last page" href="/searchresults?st=fake&pageID=' + str(self.pages) + '">' + str(self.pages) + "</a>"
+                "</body></html>").encode()
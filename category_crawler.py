@@ -0,0 +1,110 @@
+############ concurrent crawler for the FRED category tree ######################################
+############ starting from the selected category IDs it walks down the tree breadth first, ########
+############ to any depth, and pulls every series from the leaf categories it reaches. ############
+############ requests are spread over a pool of workers, and a token bucket keeps the whole ######
+############ pool under FRED's request quota instead of sleeping a fixed time between calls. ######
+############ shared_bucket hands out one bucket per API key, so everything in the process using ###
+############ that key (crawls and analysis fetches alike) draws on the same quota ##################
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import metrics
+
+### FRED allows 120 requests per minute for each API key ###
+FRED_REQUESTS_PER_MINUTE = 120
+SERIES_PAGE_SIZE = 1000
+
+
+class TokenBucket:
+
+    def __init__(self, rate_per_second, capacity):
+        self.rate = rate_per_second
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    ### block until a token is available, then take it ####
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_for = (1 - self.tokens) / self.rate
+            time.sleep(wait_for)
+            metrics.inc('throttle_sleep_seconds_total', wait_for)
+
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+### the process-wide bucket for an API key (or key file), created on first use ###
+def shared_bucket(key, requests_per_minute=FRED_REQUESTS_PER_MINUTE):
+    with _buckets_lock:
+        if key not in _buckets:
+            _buckets[key] = TokenBucket(requests_per_minute / 60, capacity=1)
+        return _buckets[key]
+
+
+def crawl_categories(category_ids, on_series, make_fred, workers=4, requests_per_minute=FRED_REQUESTS_PER_MINUTE, children=None,
+                     bucket=None):
+    ### on_series(category_id, page) is called with each page of series dicts as ###
+    ### soon as it arrives. make_fred builds one Fred client per worker, since the ##
+    ### client keeps state about the last request and can't be shared between #####
+    ### threads. children, if given, maps a category ID to its child IDs (e.g. a ###
+    ### CategoryIndex lookup) and replaces the get_child_categories calls. bucket, ##
+    ### if given, is used instead of one made from requests_per_minute ############
+    bucket = bucket if bucket is not None else TokenBucket(requests_per_minute / 60, capacity=workers)
+    local = threading.local()
+
+    def fred():
+        if not hasattr(local, 'fred'):
+            local.fred = make_fred()
+        return local.fred
+
+    def child_ids(category_id):
+        if children is not None:
+            return list(children(category_id))
+        bucket.acquire()
+        metrics.inc('api_calls_total', endpoint='category/children')
+        response = fred().get_child_categories(category_id) or {}
+        return [d['id'] for d in response.get('categories', [])]
+
+    ### page through the series in a leaf category with offsets, so categories ####
+    ### holding more than one page of series are returned in full ###############
+    def add_series(category_id):
+        offset = 0
+        while True:
+            bucket.acquire()
+            metrics.inc('api_calls_total', endpoint='category/series')
+            response = fred().get_series_in_a_category(category_id, limit=SERIES_PAGE_SIZE, offset=offset) or {}
+            page = response.get('seriess', [])
+            if len(page) > 0:
+                on_series(category_id, page)
+            offset += len(page)
+            if len(page) == 0 or offset >= response.get('count', 0):
+                break
+
+    def visit(category_id):
+        children = child_ids(category_id)
+        if len(children) == 0:
+            add_series(category_id)
+        return children
+
+    seen = set(category_ids)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = {pool.submit(visit, i) for i in seen}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                for child in future.result():
+                    if child not in seen:
+                        seen.add(child)
+                        pending.add(pool.submit(visit, child))
@@ -0,0 +1,123 @@
+############ in-memory index of the FRED category tree #########################################
+############ built once from categories.csv (id, name, parent_id). it answers the dropdown #########
+############ lookups and resolves a selection down to its leaf categories without scanning #######
+############ the whole table or calling the API. the table is also compiled to a compact binary ##
+############ file next to the csv (int32 arrays plus utf-8 names), which loads without pandas ####
+############ parsing the csv. rebuild it with `python category_index.py categories.csv` ##########
+
+import hashlib
+import os
+import sys
+from collections import defaultdict
+
+import numpy as np
+
+ROOT_ID = 0
+COMPILED_SUFFIX = ".npz"
+
+
+def _compiled_path(path):
+    return os.path.splitext(path)[0] + COMPILED_SUFFIX
+
+
+def _digest(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+class CategoryIndex:
+
+    def __init__(self, ids, names, parent_ids):
+        self.name = dict(zip(ids, names))
+        self.parent = dict(zip(ids, parent_ids))
+        self.children = defaultdict(list)
+        for category_id, parent_id in zip(ids, parent_ids):
+            self.children[parent_id].append(category_id)
+
+        ### leaf categories below every node, filled in bottom up in one pass ###
+        self.leaves = {}
+        for category_id in reversed(self._breadth_first(ROOT_ID)):
+            kids = self.children.get(category_id, [])
+            if len(kids) == 0:
+                self.leaves[category_id] = [category_id]
+            else:
+                self.leaves[category_id] = [leaf for kid in kids for leaf in self.leaves[kid]]
+
+    @classmethod
+    def from_csv(cls, path):
+        import pandas as pd
+
+        df = pd.read_csv(path)
+        return cls(df['id'].tolist(), df['name'].tolist(), df['parent_id'].tolist())
+
+    ### the compiled table, if it was built from this csv's contents, else the csv itself. ####
+    ### a missing or out of date compiled file is rebuilt along the way #######################
+    @classmethod
+    def load(cls, path):
+        compiled = _compiled_path(path)
+        digest = _digest(path) if os.path.exists(path) else None
+        if os.path.exists(compiled):
+            with np.load(compiled) as data:
+                if digest is None or str(data['source']) == digest:
+                    names = bytes(data['names']).decode('utf-8')
+                    bounds = data['name_offsets'].tolist()
+                    return cls(data['ids'].tolist(), [names[a:b] for a, b in zip(bounds[:-1], bounds[1:])],
+                               data['parent_ids'].tolist())
+        try:
+            return compile_csv(path)
+        except OSError:
+            return cls.from_csv(path)
+
+    def _breadth_first(self, start):
+        order = [start]
+        i = 0
+        while i < len(order):
+            order.extend(self.children.get(order[i], []))
+            i += 1
+        return order
+
+    ### (id, name) pairs of the children of the given categories, in file order ###
+    def child_categories(self, parent_ids):
+        return [(i, self.name[i]) for p in parent_ids for i in self.children.get(p, [])]
+
+    ### IDs of the children of parent_ids whose names were selected ###
+    def selected_children(self, parent_ids, names):
+        names = set(names)
+        return [i for i, name in self.child_categories(parent_ids) if name in names]
+
+    def descendants(self, category_id):
+        return self._breadth_first(category_id)[1:]
+
+    ### every leaf category under the given categories, without duplicates ###
+    def leaf_categories(self, category_ids):
+        seen = set()
+        leaves = []
+        for category_id in category_ids:
+            for leaf in self.leaves.get(category_id, [category_id]):
+                if leaf not in seen:
+                    seen.add(leaf)
+                    leaves.append(leaf)
+        return leaves
+
+
+### parse the csv and write the compiled table next to it; returns the index ###
+def compile_csv(path):
+    import pandas as pd
+
+    df = pd.read_csv(path)
+    names = [str(name) for name in df['name']]
+    ### offsets are in characters, so slicing the decoded string gives each name back ###
+    offsets = np.cumsum([0] + [len(name) for name in names]).astype(np.int64)
+    tmp = _compiled_path(path) + ".tmp"
+    with open(tmp, 'wb') as f:
+        np.savez(f, ids=df['id'].to_numpy(dtype=np.int32), parent_ids=df['parent_id'].to_numpy(dtype=np.int32),
+                 names=np.frombuffer("".join(names).encode('utf-8'), dtype=np.uint8), name_offsets=offsets,
+                 source=np.array(_digest(path)))
+    os.replace(tmp, _compiled_path(path))
+    return CategoryIndex(df['id'].tolist(), names, df['parent_id'].tolist())
+
+
+if __name__ == "__main__":
+    source = sys.argv[1] if len(sys.argv) > 1 else "categories.csv"
+    index = compile_csv(source)
+    print("Compiled", len(index.name), "categories to", _compiled_path(source))
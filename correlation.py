@@ -0,0 +1,151 @@
+############ vectorized lagged correlation engine ##############################################
+############ computes pearson and spearman correlations, with p-values, between one baseline ######
+############ and a whole matrix of series at every lag in a handful of numpy operations. ##########
+############ the formulas follow scipy.stats.pearsonr and spearmanr so results match the ##########
+############ per-pair scipy calls core_analysis used to make ######################################
+
+import numpy as np
+from scipy import special, stats
+from scipy.stats import pearsonr, spearmanr
+
+RESULT_COLUMNS = ['pearsoncorr', 'pearson_pval', 'spearmancorr', 'spearman_pval']
+
+
+### pearson r of x against every column of Y, following scipy.stats.pearsonr ###
+def _pearson_r(x, Y):
+    xm = x - x.mean()
+    Ym = Y - Y.mean(axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r = (xm / np.linalg.norm(xm)) @ (Ym / np.linalg.norm(Ym, axis=0))
+    r = np.clip(r, -1.0, 1.0)
+
+    ### a constant input leaves the correlation undefined ###
+    constant = (Y == Y[0]).all(axis=0) | (x == x[0]).all()
+    r[constant] = np.nan
+    return r
+
+
+def _pearson(x, Y):
+    n = x.shape[0]
+    r = _pearson_r(x, Y)
+    ab = n / 2 - 1
+    p = 2 * stats.beta(ab, ab, loc=-1, scale=2).sf(np.abs(r))
+    return r, p
+
+
+### average ranks from values already sorted down each column. tied values ####
+### share the mean of their positions, the same as rankdata's default ########
+def _average_ranks(sorted_values, order):
+    n = sorted_values.shape[0]
+    positions = np.arange(1, n + 1)[:, None]
+    starts = np.ones(sorted_values.shape, dtype=bool)
+    starts[1:] = sorted_values[1:] != sorted_values[:-1]
+    ends = np.ones(sorted_values.shape, dtype=bool)
+    ends[:-1] = starts[1:]
+    first = np.maximum.accumulate(np.where(starts, positions, 0), axis=0)
+    last = np.minimum.accumulate(np.where(ends, positions, n + 1)[::-1], axis=0)[::-1]
+    ranks = np.empty(sorted_values.shape)
+    np.put_along_axis(ranks, order, (first + last) / 2, axis=0)
+    return ranks
+
+
+### ranks within rows start:stop of each column, reusing the sort order of ####
+### the full column instead of sorting every lagged slice again #############
+def _segment_ranks(values, order, start, stop):
+    keep = (order >= start) & (order < stop)
+    segment_order = order.T[keep.T].reshape(values.shape[1], stop - start).T - start
+    sorted_values = np.take_along_axis(values[start:stop], segment_order, axis=0)
+    return _average_ranks(sorted_values, segment_order)
+
+
+### spearman rho from ranked x and Y, following scipy.stats.spearmanr ###
+def _spearman(xr, Yr, x, Y):
+    n = xr.shape[0]
+    has_nan = np.isnan(Y).any(axis=0) | np.isnan(x).any()
+    constant = (Y == Y[0]).all(axis=0) | (x == x[0]).all()
+
+    xm = xr - xr.mean()
+    Ym = Yr - Yr.mean(axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cov = (xm @ Ym) / (n - 1)
+        rs = cov / np.sqrt((xm @ xm) / (n - 1)) / np.sqrt((Ym * Ym).sum(axis=0) / (n - 1))
+    rs = np.clip(rs, -1.0, 1.0)
+    rs[has_nan | constant] = np.nan
+
+    dof = n - 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = rs * np.sqrt((dof / ((rs + 1.0) * (1.0 - rs))).clip(0))
+    p = special.stdtr(dof, -np.abs(t)) * 2
+    return rs, p
+
+
+def max_abs_pearson(base, values, max_lag):
+    ### the cheap screening pass: the largest |pearson r| each series reaches at ####
+    ### any lag, with no ranks or p-values. lags the full engine would record as ####
+    ### zeros (too few rows, missing or constant data) count as 0 ##################
+    base = np.asarray(base, dtype=float)
+    values = np.asarray(values, dtype=float)
+    if values.ndim == 1:
+        values = values[:, None]
+    n_obs, n_series = values.shape
+
+    strongest = np.zeros(n_series)
+    for lag in range(max_lag + 1):
+        rows = n_obs - lag
+        if rows < 2:
+            break
+        r = np.abs(_pearson_r(base[lag:], values[:rows]))
+        np.fmax(strongest, np.where(np.isfinite(r), r, 0), out=strongest)
+    return strongest
+
+
+def lagged_correlations(base, values, max_lag, min_lag=0):
+    ### base is the baseline column, values is an (observations x series) matrix ####
+    ### aligned on the same dates. at lag i the baseline is shifted forward i #######
+    ### periods, pairing base[i:] with values[:n-i]. returns one (lags x series) ###
+    ### array per entry of RESULT_COLUMNS, for lags min_lag..max_lag. every lag ####
+    ### is computed independently, so a run can be extended to more lags later ####
+    base = np.asarray(base, dtype=float)
+    values = np.asarray(values, dtype=float)
+    if values.ndim == 1:
+        values = values[:, None]
+    n_obs, n_series = values.shape
+
+    results = {column: np.zeros((max_lag + 1 - min_lag, n_series)) for column in RESULT_COLUMNS}
+
+    ### sort each column once; every lag's ranks are read off these orders ###
+    base_order = np.argsort(base, kind='mergesort')[:, None]
+    values_order = np.argsort(values, axis=0, kind='mergesort')
+    for lag in range(min_lag, max_lag + 1):
+        rows = n_obs - lag
+        x = base[lag:]
+        Y = values[:rows]
+        out = lag - min_lag
+
+        if rows < 2:
+            ### scipy refuses samples this small, which the old loop recorded as zeros ###
+            continue
+        elif rows == 2:
+            for j in range(n_series):
+                try:
+                    pcorr = pearsonr(x, Y[:, j])
+                    scorr = spearmanr(x, Y[:, j])
+                except ValueError:
+                    continue
+                results['pearsoncorr'][out, j], results['pearson_pval'][out, j] = pcorr
+                results['spearmancorr'][out, j], results['spearman_pval'][out, j] = scorr
+            continue
+
+        results['pearsoncorr'][out], results['pearson_pval'][out] = _pearson(x, Y)
+        xr = _segment_ranks(base[:, None], base_order, lag, n_obs)[:, 0]
+        Yr = _segment_ranks(values, values_order, 0, rows)
+        results['spearmancorr'][out], results['spearman_pval'][out] = _spearman(xr, Yr, x, Y)
+
+        ### pearsonr raises on missing or infinite values in a non-constant input, ####
+        ### which the old loop caught and recorded as zeros for that lag ##############
+        constant = (Y == Y[0]).all(axis=0) | (x == x[0]).all()
+        invalid = ~np.isfinite(Y).all(axis=0) | ~np.isfinite(x).all()
+        for column in RESULT_COLUMNS:
+            results[column][out, invalid & ~constant] = 0
+
+    return results
@@ -0,0 +1,126 @@
+############ near-duplicate series grouping ######################################################
+############ FRED lists are full of series that are effectively the same data: the same ##########
+############ indicator in different units, seasonally adjusted copies that barely differ, ########
+############ regional series that track the national one. each series is reduced to a signature, #
+############ its values centred and scaled to unit length over the periods it has, so the dot ####
+############ product of two signatures is their pearson correlation. series observed on the ######
+############ same periods whose correlation reaches the threshold form a group, and only the #####
+############ first series of each group (its representative) needs its own correlations #########
+
+import numpy as np
+
+### correlation two series need with each other to be treated as one ###
+DUPLICATE_THRESHOLD = 0.999
+
+### candidate series are compared with each other this many at a time ###
+BLOCK_SIZE = 512
+
+### periods used for the first, cheap comparison against the representatives ###
+SAMPLE_ROWS = 16
+
+### slack on the sampled comparison, which is done in float32 ###
+SAMPLE_TOLERANCE = 1e-5
+
+
+def signatures(values):
+    ### (periods x series) values, all observed -> unit-length centred columns. ####
+    ### a constant column has no direction and comes back as all NaN ##############
+    centred = values - values.mean(axis=0)
+    norms = np.linalg.norm(centred, axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return centred / np.where(norms > 0, norms, np.nan)
+
+
+def _sample_rows(n_rows):
+    return np.unique(np.linspace(0, n_rows - 1, min(n_rows, SAMPLE_ROWS)).round().astype(int))
+
+
+class DuplicateGroups:
+    ### representatives found so far, kept per observation pattern, so series from ####
+    ### later batches of a run are grouped with the ones seen in earlier batches ######
+
+    def __init__(self, threshold=DUPLICATE_THRESHOLD, min_observations=2):
+        self.threshold = threshold
+        self.min_observations = min_observations
+        ### member series ID -> its representative's ###
+        self.representative = {}
+        ### observation pattern -> (representative IDs, their signatures as columns, ####
+        ### and the sampled rows of the signatures in float32) ###########################
+        self._patterns = {}
+
+    def __len__(self):
+        return len(self.representative)
+
+    def _candidates(self, signs, rep_signs, rep_sample):
+        ### correlation r between unit signatures means a squared distance of 2(1 - r). ####
+        ### the distance over a sample of periods can only be smaller, so pairs already ####
+        ### too far apart on the sample are ruled out, and only the rest are checked on ###
+        ### every period. returns the best representative for each series, or -1 ##########
+        rows = _sample_rows(signs.shape[0])
+        sample = signs[rows].astype(np.float32)
+        distance = sample.T @ rep_sample
+        distance *= -2
+        distance += (sample * sample).sum(axis=0)[:, None]
+        distance += (rep_sample * rep_sample).sum(axis=0)
+        series, reps = np.nonzero(distance <= 2 * (1 - self.threshold) + SAMPLE_TOLERANCE)
+        r = np.einsum('ij,ij->j', signs[:, series], rep_signs[:, reps])
+        found = r >= self.threshold
+        series, reps, r = series[found], reps[found], r[found]
+        ### the closest representative wins ###
+        order = np.lexsort((-r, series))
+        series, reps = series[order], reps[order]
+        first = np.ones(len(series), dtype=bool)
+        first[1:] = series[1:] != series[:-1]
+        best = np.full(signs.shape[1], -1)
+        best[series[first]] = reps[first]
+        return best
+
+    def _match(self, pattern, codes, signs):
+        ### compare one block of signatures with the pattern's representatives, then ####
+        ### with each other. the first unmatched series of the block starts a group ####
+        rows = _sample_rows(signs.shape[0])
+        reps, rep_signs, rep_sample = self._patterns.get(pattern, ([], signs[:, :0], signs[rows, :0].astype(np.float32)))
+        matched = np.full(len(codes), -1)
+        if len(reps) > 0:
+            matched = self._candidates(signs, rep_signs, rep_sample)
+
+        new = []
+        similarity = signs.T @ signs
+        for i in range(len(codes)):
+            if matched[i] >= 0:
+                continue
+            matched[i] = len(reps) + len(new)
+            new.append(i)
+            later = np.arange(i + 1, len(codes))
+            matched[later[(matched[i + 1:] < 0) & (similarity[i, i + 1:] >= self.threshold)]] = matched[i]
+
+        reps = reps + [codes[i] for i in new]
+        self._patterns[pattern] = (reps, np.concatenate([rep_signs, signs[:, new]], axis=1),
+                                   np.concatenate([rep_sample, signs[rows][:, new].astype(np.float32)], axis=1))
+        for code, group in zip(codes, matched):
+            if reps[group] != code:
+                self.representative[code] = reps[group]
+
+    ### group the series of a (periods x series) frame with each other and with those ####
+    ### seen before. returns member series ID -> representative ID for the members in ####
+    ### this frame; representatives and series that match nothing are left out ##########
+    def assign(self, panel):
+        values = panel.to_numpy(dtype=float)
+        observed = ~np.isnan(values)
+        groups = {}
+        for j, code in enumerate(panel.columns):
+            if code in self.representative or observed[:, j].sum() < self.min_observations:
+                continue
+            groups.setdefault(np.packbits(observed[:, j]).tobytes(), []).append(j)
+
+        for pattern, columns in groups.items():
+            rows = np.flatnonzero(observed[:, columns[0]])
+            signs = signatures(values[rows][:, columns])
+            ### constant series can't be told apart by correlation and stay on their own ###
+            usable = ~np.isnan(signs).any(axis=0)
+            columns, signs = np.asarray(columns)[usable], signs[:, usable]
+            for start in range(0, len(columns), BLOCK_SIZE):
+                block = slice(start, start + BLOCK_SIZE)
+                self._match(pattern, [panel.columns[j] for j in columns[block]], signs[:, block])
+
+        return {code: self.representative[code] for code in panel.columns if code in self.representative}
@@ -0,0 +1,78 @@
+############ streamed file exports for the series and results downloads ##########################
+############ frames are written a chunk of rows at a time into a small in-memory buffer, which is ##
+############ handed to the download and emptied again, so a large export starts right away and ###
+############ never holds more than one chunk's worth of output. CSV, Parquet (one row group per ###
+############ chunk) and Arrow IPC are supported, the binary formats compressed with zstd #########
+
+import io
+
+### format -> (label, file extension, media type) ###
+EXPORT_FORMATS = {
+    'csv': ("CSV", "csv", "text/csv"),
+    'parquet': ("Parquet (zstd)", "parquet", "application/vnd.apache.parquet"),
+    'arrow': ("Arrow IPC (zstd)", "arrow", "application/vnd.apache.arrow.file"),
+}
+EXPORT_CHOICES = {name: label for name, (label, _, _) in EXPORT_FORMATS.items()}
+
+CHUNK_ROWS = 50000
+COMPRESSION = "zstd"
+
+
+def filename(stem, export_format):
+    return stem + "." + EXPORT_FORMATS[export_format][1]
+
+
+def media_type(export_format):
+    return EXPORT_FORMATS[export_format][2]
+
+
+def _chunks(frame, rows, chunk_rows):
+    ### slices of frame, or of the given row positions of frame, chunk_rows at a time ###
+    total = frame.shape[0] if rows is None else len(rows)
+    for start in range(0, max(total, 1), chunk_rows):
+        if rows is None:
+            yield frame.iloc[start:start + chunk_rows]
+        else:
+            yield frame.iloc[rows[start:start + chunk_rows]]
+
+
+def _drain(buffer):
+    data = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    return data
+
+
+def stream_frame(frame, export_format='csv', rows=None, chunk_rows=CHUNK_ROWS):
+    ### yield frame (or just the rows at the given positions) as bytes in export_format ###
+    buffer = io.BytesIO()
+    if export_format == 'csv':
+        for i, chunk in enumerate(_chunks(frame, rows, chunk_rows)):
+            chunk.to_csv(buffer, index=False, header=(i == 0), encoding='utf-8')
+            yield _drain(buffer)
+        return
+
+    import pyarrow as pa
+
+    ### the schema comes from the whole frame, since a column can be all missing in ####
+    ### one chunk (and typed null there) but hold strings in the next #################
+    schema = pa.Schema.from_pandas(frame, preserve_index=False)
+    writer = None
+    try:
+        for chunk in _chunks(frame, rows, chunk_rows):
+            table = pa.Table.from_pandas(chunk, schema=schema, preserve_index=False)
+            if writer is None:
+                if export_format == 'parquet':
+                    import pyarrow.parquet as pq
+                    writer = pq.ParquetWriter(buffer, schema, compression=COMPRESSION)
+                elif export_format == 'arrow':
+                    writer = pa.ipc.new_file(buffer, schema, options=pa.ipc.IpcWriteOptions(compression=COMPRESSION))
+                else:
+                    raise ValueError("Unknown export format: " + str(export_format))
+            writer.write_table(table)
+            yield _drain(buffer)
+    finally:
+        if writer is not None:
+            writer.close()
+    ### the footer is written on close ###
+    yield _drain(buffer)
@@ -0,0 +1,58 @@
+############ baseline file ingestion ##########################################################
+############ uploaded baseline CSVs are parsed in parallel with pyarrow's CSV reader. only the ####
+############ value column has percent signs stripped, and parsed frames are cached by a hash ######
+############ of the file contents, so uploading the same file again skips parsing entirely ########
+
+import hashlib
+import io
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+import metrics
+
+### how many parsed files to keep around, oldest dropped first ###
+CACHE_SIZE = 128
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _parse(content):
+    df = pd.read_csv(io.BytesIO(content), engine='pyarrow')
+    df = df.iloc[:, 0:2]
+    if df.shape[0] > 0 and df.iloc[:, 1].dtype == object:
+        values = df.iloc[:, 1].astype(str).str.replace('%', '', regex=False)
+        df[df.columns[1]] = pd.to_numeric(values)
+    return df
+
+
+### parse one baseline file, or return a copy of the frame parsed from identical contents ###
+def parse_baseline(path):
+    with open(path, 'rb') as f:
+        content = f.read()
+    digest = hashlib.sha256(content).hexdigest()
+
+    with _cache_lock:
+        cached = _cache.get(digest)
+        if cached is not None:
+            _cache.move_to_end(digest)
+    metrics.inc('cache_misses_total' if cached is None else 'cache_hits_total', cache='baseline_files')
+    if cached is None:
+        cached = _parse(content)
+        with _cache_lock:
+            _cache[digest] = cached
+            while len(_cache) > CACHE_SIZE:
+                _cache.popitem(last=False)
+    ### callers edit the frames they get (e.g. date normalization), so hand out copies ###
+    return cached.copy()
+
+
+### parse every uploaded file in parallel. files are shiny upload dicts with ####
+### 'name' and 'datapath'; returns file name -> frame, in upload order #########
+def parse_baselines(files, workers=4):
+    with metrics.timer('ingest'), ThreadPoolExecutor(max_workers=workers) as pool:
+        frames = list(pool.map(parse_baseline, [f['datapath'] for f in files]))
+    return {f['name']: df for f, df in zip(files, frames)}
@@ -0,0 +1,58 @@
+############ state shared between a background analysis job and the session watching it ##########
+############ the worker thread reports progress and checks for cancellation here, and the ########
+############ session polls it to draw the progress bar ###########################################
+
+import threading
+import time
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+
+    def __init__(self, total):
+        self.total = total
+        self.done = 0
+        self.api_calls = 0
+        self.started = time.time()
+        self.future = None
+        self.results = []
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+
+    ### called by the worker after each unit of work ###
+    def advance(self, steps=1, api_calls=0):
+        with self._lock:
+            self.done += steps
+            self.api_calls += api_calls
+
+    ### called by the worker with each batch of finished results ###
+    def publish(self, frame):
+        with self._lock:
+            self.results.append(frame)
+
+    def cancel(self):
+        self._cancel.set()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    ### raise JobCancelled in the worker once the user has pressed cancel ###
+    def check_cancelled(self):
+        if self._cancel.is_set():
+            raise JobCancelled()
+
+    ### sleep that wakes up early when the job is cancelled ###
+    def sleep(self, seconds):
+        if self._cancel.wait(seconds):
+            raise JobCancelled()
+
+    ### seconds left, estimated from the average time per finished unit ###
+    def eta(self):
+        if self.done == 0:
+            return None
+        elapsed = time.time() - self.started
+        return elapsed / self.done * (self.total - self.done)
@@ -0,0 +1,90 @@
+############ process-wide counters and stage timers ############################################
+############ the hot paths (API calls, cache lookups, throttling, each pipeline stage) report ######
+############ here. the numbers are shown in the app's Diagnostics tab and served in Prometheus ####
+############ text format at /metrics ############################################################
+
+import threading
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+
+PREFIX = "fred_app_"
+
+### metric name -> help text, for the Prometheus exposition ###
+COUNTERS = {
+    'api_calls_total': "Requests made to the FRED API, by endpoint",
+    'retries_total': "Requests retried after a failure, by source",
+    'cache_hits_total': "Lookups answered from a cache, by cache",
+    'cache_misses_total': "Lookups a cache could not answer, by cache",
+    'series_skipped_total': "Series left out of an analysis, by reason",
+    'duplicates_total': "Series given their representative's correlations instead of their own",
+    'throttle_sleep_seconds_total': "Seconds spent waiting on the FRED throttle",
+}
+STAGE_HELP = "Time spent in each pipeline stage"
+
+_lock = threading.Lock()
+_counters = {}
+_stages = {}
+
+
+def _key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def inc(name, value=1, **labels):
+    with _lock:
+        key = (name, _key(labels))
+        _counters[key] = _counters.get(key, 0) + value
+
+
+### time the body of the with block as one run of the named stage ###
+@contextmanager
+def timer(stage):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        with _lock:
+            total, count = _stages.get(stage, (0.0, 0))
+            _stages[stage] = (total + elapsed, count + 1)
+
+
+### one row per counter and stage, for display ###
+def snapshot():
+    with _lock:
+        counters = list(_counters.items())
+        stages = list(_stages.items())
+    rows = [{'metric': name, 'labels': ", ".join(k + "=" + str(v) for k, v in labels), 'value': value, 'runs': None,
+             'mean_seconds': None}
+            for (name, labels), value in sorted(counters)]
+    rows += [{'metric': 'stage_seconds_total', 'labels': "stage=" + stage, 'value': round(total, 3), 'runs': count,
+              'mean_seconds': round(total / count, 4)}
+             for stage, (total, count) in sorted(stages)]
+    return pd.DataFrame(rows, columns=['metric', 'labels', 'value', 'runs', 'mean_seconds'])
+
+
+def _labels(labels):
+    if len(labels) == 0:
+        return ""
+    return "{" + ",".join(k + '="' + str(v).replace('"', '\\"') + '"' for k, v in labels) + "}"
+
+
+def prometheus_text():
+    with _lock:
+        counters = sorted(_counters.items())
+        stages = sorted(_stages.items())
+    lines = []
+    for name, help_text in COUNTERS.items():
+        lines.append("# HELP " + PREFIX + name + " " + help_text)
+        lines.append("# TYPE " + PREFIX + name + " counter")
+        for (counter, labels), value in counters:
+            if counter == name:
+                lines.append(PREFIX + name + _labels(labels) + " " + repr(float(value)))
+    lines.append("# HELP " + PREFIX + "stage_seconds " + STAGE_HELP)
+    lines.append("# TYPE " + PREFIX + "stage_seconds summary")
+    for stage, (total, count) in stages:
+        lines.append(PREFIX + 'stage_seconds_sum{stage="' + stage + '"} ' + repr(total))
+        lines.append(PREFIX + 'stage_seconds_count{stage="' + stage + '"} ' + str(count))
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,136 @@
+############ local on-disk store for FRED observations ##########################################
+############ every series pulled from the API is written to a sqlite file keyed by series ID, ######
+############ along with the date range already pulled and when it was last refreshed. #############
+############ repeat runs only go to the API for date ranges the store doesn't have yet ############
+
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+import pandas as pd
+
+import metrics
+
+### location and freshness of the store can be set from the environment ###
+DEFAULT_PATH = os.environ.get("FRED_CACHE_PATH", "fred_cache.sqlite")
+DEFAULT_TTL_HOURS = float(os.environ.get("FRED_CACHE_TTL_HOURS", 24))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS observations (
+    series_id TEXT NOT NULL,
+    date TEXT NOT NULL,
+    value TEXT,
+    PRIMARY KEY (series_id, date)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS series_meta (
+    series_id TEXT PRIMARY KEY,
+    observation_start TEXT NOT NULL,
+    observation_end TEXT NOT NULL,
+    fetched_at REAL NOT NULL
+);
+"""
+
+
+def _to_date(value):
+    return pd.Timestamp(value).date()
+
+
+class ObservationStore:
+
+    def __init__(self, path=DEFAULT_PATH, ttl_hours=DEFAULT_TTL_HOURS, bucket=None):
+        ### bucket, a TokenBucket, is drawn on before every API call, so every thread ####
+        ### using the store stays within one request quota ################################
+        self.path = path
+        self.bucket = bucket
+        self.ttl_seconds = ttl_hours * 3600
+        self.api_calls = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    ### work out which date ranges are missing from the store for this series. ####
+    ### a stale series (older than the TTL) is pulled again in full ##############
+    def _missing_ranges(self, conn, series_id, start, end):
+        meta = conn.execute(
+            "SELECT observation_start, observation_end, fetched_at FROM series_meta WHERE series_id = ?",
+            (series_id,)
+        ).fetchone()
+
+        if meta is None or time.time() - meta[2] > self.ttl_seconds:
+            return [(start, end)], None
+
+        covered_start, covered_end = _to_date(meta[0]), _to_date(meta[1])
+        ranges = []
+        if start < covered_start:
+            ranges.append((start, covered_start - timedelta(days=1)))
+        if end > covered_end:
+            ranges.append((covered_end + timedelta(days=1), end))
+        return ranges, (covered_start, covered_end, meta[2])
+
+    ### API calls made by the current thread, so concurrent runs sharing the ####
+    ### store each report their own traffic ####################################
+    @property
+    def thread_api_calls(self):
+        return getattr(self._local, 'api_calls', 0)
+
+    ### same interface as Fred.get_series_df, minus the realtime columns ####
+    ### returns a frame with 'date' and 'value' columns, both as strings, ###
+    ### and when the series was last refreshed in attrs['fetched_at'] #######
+    def get_series_df(self, fred, series_id, observation_start, observation_end):
+        start, end = _to_date(observation_start), _to_date(observation_end)
+
+        with self._lock, self._connect() as conn:
+            ranges, covered = self._missing_ranges(conn, series_id, start, end)
+        metrics.inc('cache_misses_total' if ranges else 'cache_hits_total', cache='observations')
+
+        ### the API is called outside the lock, so other series aren't held up ###
+        fetched = []
+        for range_start, range_end in ranges:
+            if self.bucket is not None:
+                self.bucket.acquire()
+            fetched.append(fred.get_series_df(series_id, observation_start=str(range_start), observation_end=str(range_end)))
+            with self._lock:
+                self.api_calls += 1
+            self._local.api_calls = self.thread_api_calls + 1
+            metrics.inc('api_calls_total', endpoint='series/observations')
+
+        fetched_at = covered[2] if covered is not None else None
+        with self._lock, self._connect() as conn:
+            if ranges:
+                if covered is None:
+                    ### new or stale: whatever was stored for this series is replaced ###
+                    conn.execute("DELETE FROM observations WHERE series_id = ?", (series_id,))
+                    new_start, new_end, fetched_at = start, end, time.time()
+                else:
+                    new_start, new_end, fetched_at = min(start, covered[0]), max(end, covered[1]), covered[2]
+                for frame in fetched:
+                    if frame.shape[0] > 0:
+                        conn.executemany(
+                            "INSERT OR REPLACE INTO observations (series_id, date, value) VALUES (?, ?, ?)",
+                            zip([series_id] * frame.shape[0], frame['date'], frame['value'])
+                        )
+                conn.execute(
+                    "INSERT OR REPLACE INTO series_meta (series_id, observation_start, observation_end, fetched_at) VALUES (?, ?, ?, ?)",
+                    (series_id, str(new_start), str(new_end), fetched_at)
+                )
+
+            frame = pd.read_sql_query(
+                "SELECT date, value FROM observations WHERE series_id = ? AND date BETWEEN ? AND ? ORDER BY date",
+                conn,
+                params=(series_id, str(start), str(end))
+            )
+        frame.attrs['fetched_at'] = fetched_at
+        return frame
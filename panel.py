@@ -0,0 +1,95 @@
+############ compact memory-mapped dates x series panel ###########################################
+############ aligned observations are kept as one float32 matrix in a file on disk, with an index ##
+############ of dates (or periods) for the rows and of series IDs for the columns. the file is ####
+############ laid out series by series, so adding series only extends it, and the dates x series ##
+############ matrix handed out for a run of series is a view of the mapping rather than a copy. ###
+############ the OS pages it in and out as needed, so a panel bigger than RAM can still be used ###
+
+import os
+import tempfile
+import weakref
+
+import numpy as np
+import pandas as pd
+
+### where temporary panel files go, can be set from the environment ###
+PANEL_DIR = os.environ.get("FRED_PANEL_DIR", None)
+
+### float32 halves the footprint; values keep about 7 significant digits ###
+DTYPE = np.float32
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class SeriesPanel:
+
+    def __init__(self, index, path=None, capacity=256, dtype=DTYPE):
+        ### index labels the rows (dates or periods). without a path the panel lives ####
+        ### in a temporary file, removed once the panel is no longer referenced #########
+        self.index = pd.Index(index)
+        self.dtype = np.dtype(dtype)
+        self.codes = []
+        self.positions = {}
+        if path is None:
+            fd, path = tempfile.mkstemp(suffix=".panel", dir=PANEL_DIR)
+            os.close(fd)
+            weakref.finalize(self, _remove, path)
+        else:
+            open(path, 'ab').close()
+        self.path = path
+        self._data = None
+        self._map(max(1, capacity))
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __contains__(self, code):
+        return code in self.positions
+
+    ### (re)map the file with room for capacity series. growing only extends the file, ####
+    ### the series already written stay where they are ####################################
+    def _map(self, capacity):
+        row_bytes = max(1, len(self.index)) * self.dtype.itemsize
+        if self._data is not None:
+            self._data.flush()
+        with open(self.path, 'r+b') as f:
+            f.truncate(capacity * row_bytes)
+        self._data = np.memmap(self.path, dtype=self.dtype, mode='r+', shape=(capacity, max(1, len(self.index))))
+
+    ### add series. values is a (dates x series) array on this panel's index, NaN where ####
+    ### a series has no observation. series already in the panel are overwritten ##########
+    def add(self, codes, values):
+        values = np.asarray(values, dtype=self.dtype).reshape(len(self.index), len(codes))
+        new = [c for c in dict.fromkeys(codes) if c not in self.positions]
+        capacity = self._data.shape[0]
+        if len(self.codes) + len(new) > capacity:
+            while capacity < len(self.codes) + len(new):
+                capacity *= 2
+            self._map(capacity)
+        for code in new:
+            self.positions[code] = len(self.codes)
+            self.codes.append(code)
+        for j, code in enumerate(codes):
+            self._data[self.positions[code], :len(self.index)] = values[:, j]
+
+    ### (dates x series) matrix for codes, in the order given. a run of series added ####
+    ### together is a view of the mapping; any other selection is gathered into a copy ###
+    def values(self, codes=None):
+        if codes is None:
+            return self._data[:len(self.codes), :len(self.index)].T
+        rows = np.array([self.positions[c] for c in codes], dtype=np.int64)
+        if len(rows) > 0 and (np.diff(rows) == 1).all():
+            return self._data[rows[0]:rows[-1] + 1, :len(self.index)].T
+        return self._data[rows, :len(self.index)].T
+
+    def to_frame(self, codes=None):
+        codes = self.codes if codes is None else list(codes)
+        return pd.DataFrame(self.values(codes), index=self.index, columns=codes, copy=False)
+
+    def flush(self):
+        self._data.flush()
@@ -0,0 +1,79 @@
+############ per-session memo of aligned series and their correlations #########################
+############ each series' raw values, aggregated onto a baseline's periods, are kept in a #########
+############ memory-mapped SeriesPanel for that frequency and date range, so a rerun with a #######
+############ different lag or percent change skips fetching and aggregation. correlations are ####
+############ kept for the baseline's values and the percent change used, so a rerun with more ####
+############ lags only computes the new ones ####################################################
+
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from panel import SeriesPanel
+
+### how many aligned panels, and separately how many correlation memos, to keep. the ####
+### oldest are dropped first, but never while the run that last used them is current ####
+MAX_ENTRIES = 16
+
+
+def _digest(base):
+    ### baseline values indexed by period -> hash of the periods and the values ###
+    content = hashlib.sha256(np.asarray(base.index.asi8).tobytes())
+    content.update(base.to_numpy(dtype=float).tobytes())
+    content.update(str(base.index.freqstr).encode())
+    return content.hexdigest()
+
+
+class _RunLRU:
+    ### an LRU of key -> (run that last used it, value), which only drops entries ####
+    ### of earlier runs, so it grows to hold whatever the current run needs ##########
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+
+    def get(self, key, make, run):
+        value = self._entries.pop(key)[1] if key in self._entries else make()
+        self._entries[key] = (run, value)
+        while len(self._entries) > self.max_entries:
+            oldest = next(iter(self._entries))
+            if self._entries[oldest][0] == run:
+                break
+            del self._entries[oldest]
+        return value
+
+    def clear(self):
+        self._entries.clear()
+
+
+class PanelCache:
+
+    def __init__(self, max_entries=MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.run = 0
+        ### separate, so a run with many baselines can't push out its own panels ###
+        self._aligned = _RunLRU(max_entries)
+        self._correlations = _RunLRU(max_entries)
+
+    ### entries used from here on are kept at least until the next run begins ###
+    def begin_run(self):
+        self.run += 1
+
+    ### SeriesPanel of raw aggregated values on every period of freq from start to end, ####
+    ### for series fetched over that range and aggregated with aggregation #################
+    def aligned(self, freq, start, end, aggregation):
+        return self._aligned.get((freq, start, end, aggregation),
+                                 lambda: SeriesPanel(pd.period_range(start, end, freq=freq)), self.run)
+
+    ### series ID -> correlations against this baseline after the given transform and ###
+    ### rolling (window, threshold). an entry is either ('stats', {column: array over ####
+    ### lags 0..n}), or ('out', lag, screen) for a series that was left out at that lag ##
+    ### and screen #######################################################################
+    def correlations(self, base, start, end, aggregation, pct_change, rolling=None):
+        return self._correlations.get((_digest(base), start, end, aggregation, pct_change, rolling), dict, self.run)
+
+    def clear(self):
+        self._aligned.clear()
+        self._correlations.clear()
@@ -0,0 +1,330 @@
+############ the analysis pipeline behind the "Begin Analysis" button ###########################
+############ essentially: 1) loop through baseline files ##########################################
+############              2) loop through series IDs #############################################
+############              3) for each series ID, fetch series data from FRED ####################
+############              4) align the series to the baseline's frequency ######################
+############              5) calculate spearman and pearson correlation between ##################
+############                 baseline and series data, at all lags ##############################
+############              6) store results ###################################################
+############ it takes plain values rather than shiny inputs so it can run on a worker thread ######
+
+import time
+
+import numpy as np
+import pandas as pd
+
+import metrics
+from alignment import aggregate_series, baseline_periods, transform_panel
+from correlation import lagged_correlations, max_abs_pearson, RESULT_COLUMNS
+from dedup import DuplicateGroups
+from panel_cache import PanelCache
+from rolling import ROLLING_COLUMNS, rolling_summary
+from results_store import COLUMN_DTYPES, ROLLING_DTYPES, ResultAccumulator
+
+### FRED throttling: after this many API calls, wait before carrying on ###
+THROTTLE_CALLS = 100
+THROTTLE_SECONDS = 45
+
+### correlations are computed and published after this many series have been fetched ###
+RESULT_BATCH_SIZE = 100
+
+### series with fewer overlapping observations than this are skipped ###
+MIN_OBSERVATIONS = 15
+
+
+def stat_columns(rolling=None):
+    ### the stats computed for each series and lag, with or without the rolling summary ###
+    return RESULT_COLUMNS + (ROLLING_COLUMNS if rolling is not None else [])
+
+
+def result_accumulator(rolling=None, dedup=None):
+    ### an empty ResultAccumulator with the columns a run with these settings produces ###
+    return ResultAccumulator(columns={**COLUMN_DTYPES, **(ROLLING_DTYPES if rolling is not None else {})},
+                             duplicates=dedup is not None)
+
+
+def correlate_panel(base_values, panel, lag, screen=None, min_lag=0, rolling=None):
+    ### base_values is the baseline over the panel's rows, panel is a periods x series ####
+    ### frame with NaN where a series has no observation. series are grouped by which ####
+    ### rows they share with the baseline, and each group is one call to the engine. #####
+    ### if screen is set, only series whose |pearson| reaches it at some lag get the #####
+    ### full statistics; the rest are dropped after a cheap pearson-only pass. ###########
+    ### rolling, a (window, threshold) pair, adds the rolling-window summary columns. ####
+    ### returns the series IDs kept, and their stats for lags min_lag..lag in the same ###
+    ### order ############################################################################
+    values = panel.to_numpy(dtype=float)
+    observed = ~np.isnan(values) & ~np.isnan(base_values)[:, None]
+    enough = observed.sum(axis=0) >= MIN_OBSERVATIONS
+    if (~enough).sum() > 0:
+        metrics.inc('series_skipped_total', int((~enough).sum()), reason='insufficient_data')
+
+    names = stat_columns(rolling)
+    stats = {column: np.zeros((lag + 1 - min_lag, values.shape[1])) for column in names}
+    candidate = enough.copy()
+    patterns, group_of = np.unique(observed.T, axis=0, return_inverse=True)
+    for group, rows in enumerate(patterns):
+        columns = np.flatnonzero((group_of == group) & enough)
+        if len(columns) > 0 and screen is not None:
+            passed = max_abs_pearson(base_values[rows], values[rows][:, columns], lag) >= screen
+            candidate[columns[~passed]] = False
+            columns = columns[passed]
+        if len(columns) == 0:
+            continue
+        group_stats = lagged_correlations(base_values[rows], values[rows][:, columns], lag, min_lag)
+        if rolling is not None:
+            with metrics.timer('rolling'):
+                group_stats.update(rolling_summary(base_values[rows], values[rows][:, columns], lag, *rolling, min_lag))
+        for column in names:
+            stats[column][:, columns] = group_stats[column]
+
+    if (enough & ~candidate).sum() > 0:
+        metrics.inc('series_skipped_total', int((enough & ~candidate).sum()), reason='screened_out')
+    kept = np.flatnonzero(candidate)
+    return [panel.columns[j] for j in kept], {column: stats[column][:, kept] for column in names}
+
+
+def correlate_memo(memo, base_values, panel, lag, screen=None, rolling=None):
+    ### correlate_panel, reusing the correlations memo already holds for each series ####
+    ### (see PanelCache.correlations). series it has never seen are correlated in full, ##
+    ### series it has for fewer lags only get the missing lags computed ##################
+    names = stat_columns(rolling)
+    fresh, extend = [], {}
+    for code in panel.columns:
+        entry = memo.get(code)
+        if entry is None:
+            fresh.append(code)
+        elif entry[0] == 'out':
+            ### too little data is final; a screen only holds for a tighter screen over no more lags ###
+            _, out_lag, out_screen = entry
+            if out_screen is not None and (screen is None or screen < out_screen or lag > out_lag):
+                fresh.append(code)
+        elif entry[1]['pearsoncorr'].shape[0] < lag + 1:
+            extend.setdefault(entry[1]['pearsoncorr'].shape[0], []).append(code)
+
+    if len(fresh) > 0:
+        kept, stats = correlate_panel(base_values, panel[fresh], lag, screen, rolling=rolling)
+        for code in fresh:
+            memo[code] = ('out', lag, screen)
+        for j, code in enumerate(kept):
+            memo[code] = ('stats', {column: stats[column][:, j] for column in names})
+    for have, group in extend.items():
+        kept, stats = correlate_panel(base_values, panel[group], lag, min_lag=have, rolling=rolling)
+        for j, code in enumerate(kept):
+            known = memo[code][1]
+            memo[code] = ('stats', {column: np.concatenate([known[column], stats[column][:, j]]) for column in names})
+
+    kept = []
+    for code in panel.columns:
+        entry = memo[code]
+        if entry[0] != 'stats':
+            continue
+        strongest = np.abs(np.nan_to_num(entry[1]['pearsoncorr'][:lag + 1])).max()
+        if screen is None or strongest >= screen:
+            kept.append(code)
+    stats = {column: np.zeros((lag + 1, len(kept))) for column in names}
+    for j, code in enumerate(kept):
+        for column in names:
+            stats[column][:, j] = memo[code][1][column][:lag + 1]
+    return kept, stats
+
+
+def _with_restored(codes, baseline, kept, stats, done, lag, names):
+    ### merge freshly computed stats with pairs restored from a run journal, in the ####
+    ### order of codes. done maps (baseline, code) -> stats over lags, or None #########
+    positions = {code: j for j, code in enumerate(kept)}
+    merged = []
+    columns = {column: [] for column in names}
+    for code in codes:
+        if code in positions:
+            found = {column: stats[column][:, positions[code]] for column in names}
+        else:
+            found = done.get((baseline, code))
+            if found is None:
+                continue
+        merged.append(code)
+        for column in names:
+            columns[column].append(np.asarray(found[column], dtype=float))
+    return merged, {column: np.column_stack(columns[column]) if len(merged) > 0 else np.zeros((lag + 1, 0))
+                    for column in names}
+
+
+def _member_stats(own_stats, done, baseline, members, representative, lag, screen, names):
+    ### stats for series grouped under a representative: the representative's own, ####
+    ### from own_stats ((baseline, series ID) -> its correlate_memo entry this run), ###
+    ### or from the run journal if it was finished in an earlier run. members of a ####
+    ### representative that was left out are left out too ############################
+    kept = []
+    columns = {column: [] for column in names}
+    for code in members:
+        entry = own_stats.get((baseline, representative[code]))
+        if entry is None:
+            found = done.get((baseline, representative[code]))
+        else:
+            found = entry[1] if entry[0] == 'stats' else None
+        if found is None:
+            continue
+        found = {column: np.asarray(found[column][:lag + 1], dtype=float) for column in names}
+        if screen is not None and np.abs(np.nan_to_num(found['pearsoncorr'])).max() < screen:
+            continue
+        kept.append(code)
+        for column in names:
+            columns[column].append(found[column])
+    return kept, {column: np.column_stack(columns[column]) if len(kept) > 0 else np.zeros((lag + 1, 0))
+                  for column in names}
+
+
+def _slice(frame, start, end):
+    ### rows of a fetched (date, value) frame within [start, end]. FRED dates are ####
+    ### ISO strings, so they compare in date order ##################################
+    dates = frame['date']
+    if dates.shape[0] == 0 or (dates.iloc[0] >= start and dates.iloc[-1] <= end):
+        return frame
+    return frame[(dates >= start) & (dates <= end)]
+
+
+def run_analysis(baselines, codes, lag, pct_change, store, fred, job=None, batch_size=RESULT_BATCH_SIZE, aggregation='mean',
+                 throttle_calls=THROTTLE_CALLS, screen=None, cache=None, journal=None, rolling=None, dedup=None):
+    ### baselines maps file name -> frame of (Date, value), codes is the list of ####
+    ### FRED series IDs. job, if given, receives progress, can cancel the run and ###
+    ### is handed each batch of results as soon as it is computed. aggregation ####
+    ### is how higher frequency series are brought down to the baseline's. #######
+    ### screen, if set, is the |pearson| a series must reach to be kept. cache, ###
+    ### a PanelCache, carries aligned series and correlations between runs. ######
+    ### journal, a RunJournal, records each finished (baseline, series) pair, ####
+    ### and pairs it already holds are restored instead of being run again. #####
+    ### rolling, a (window, threshold) pair, adds a rolling-window summary. ####
+    ### dedup, if set, is the correlation at which series count as duplicates: ##
+    ### only one series per group is correlated, and the rest of the group are ##
+    ### given its results, with a duplicate_of column naming it. throttle_calls ##
+    ### None leaves the throttling to the store's token bucket #################
+    cache = cache if cache is not None else PanelCache()
+    names = stat_columns(rolling)
+    done = journal.completed if journal is not None else {}
+    if len(done) > 0:
+        print("Resuming run,", len(done), "baseline/series pairs already finished")
+    restored_duplicates = journal.duplicates if journal is not None else {}
+    results = result_accumulator(rolling, dedup)
+    count = 0
+
+    ### plan the run: every baseline's frequency and date range. each series is ####
+    ### fetched once over the union of the ranges, and sliced for each baseline ####
+    plans = []
+    for key in baselines:
+        freq, base = baseline_periods(baselines[key])
+        if base.shape[0] == 0:
+            print("No usable dates in", key)
+            continue
+        ### fetch whole periods, so e.g. every month of the last quarter is included ###
+        plans.append((key, freq, base, str(base.index[0].start_time.date()), str(base.index[-1].end_time.date())))
+    if len(plans) == 0:
+        return results.to_frame()
+    OBSERVATION_START = min(plan[3] for plan in plans)
+    OBSERVATION_END = max(plan[4] for plan in plans)
+    ranges = list(dict.fromkeys((freq, base_start, base_end) for _, freq, _, base_start, base_end in plans))
+    keys_for = {r: [key for key, freq, _, base_start, base_end in plans if (freq, base_start, base_end) == r] for r in ranges}
+    ### the run's panels and memos are taken from the cache once, and kept by it until ###
+    ### a later run begins ###############################################################
+    cache.begin_run()
+    aligned_for = {r: cache.aligned(*r, aggregation) for r in ranges}
+    memo_for = {key: cache.correlations(base, base_start, base_end, aggregation, pct_change, rolling)
+                for key, _, base, base_start, base_end in plans}
+    ### duplicate groups are found on each range's panel, and carry over from batch to batch ###
+    groups = {r: DuplicateGroups(dedup, MIN_OBSERVATIONS) for r in ranges} if dedup is not None else {}
+    ### the stats of every series correlated this run, which members of a group take, ###
+    ### kept apart from the memos so members never depend on what the cache holds #######
+    own_stats = {}
+    batch = {}
+    pending = []
+
+    for position, code in enumerate(codes):
+        if job is not None:
+            job.check_cancelled()
+        pending.append(code)
+        ### series finished in the journal, or already aligned for every range still to ###
+        ### run in an earlier run, aren't fetched again #####################################
+        needed = [r for r in ranges if any((key, code) not in done for key in keys_for[r])]
+        if any(code not in aligned_for[r] for r in needed):
+            calls_before = store.thread_api_calls
+            with metrics.timer('fetch'):
+                batch[code] = store.get_series_df(fred, code, OBSERVATION_START, OBSERVATION_END)
+            ### only calls this run actually made to the API count towards its throttle ###
+            calls = store.thread_api_calls - calls_before
+        else:
+            metrics.inc('cache_hits_total', cache='aligned_series' if len(needed) > 0 else 'run_journal')
+            calls = 0
+
+        count += calls
+        if job is not None:
+            job.advance(api_calls=calls)
+        if throttle_calls is not None and count >= throttle_calls:
+            print(count, 'data sets pulled, waiting', THROTTLE_SECONDS, 'seconds to resume at', time.ctime())
+            slept = time.monotonic()
+            try:
+                if job is not None:
+                    job.sleep(THROTTLE_SECONDS)
+                else:
+                    time.sleep(THROTTLE_SECONDS)
+            finally:
+                metrics.inc('throttle_sleep_seconds_total', time.monotonic() - slept)
+            print('Resumed at', time.ctime())
+            count = 0
+
+        ### every batch_size series, align and correlate what has been collected ###
+        ### against each baseline, and publish it. baselines with the same #########
+        ### frequency and range share one aligned panel #############################
+        if (position + 1) % batch_size == 0 or position + 1 == len(codes):
+            start = len(results)
+            pending = list(dict.fromkeys(pending))
+            panels = {}
+            grouped = {}
+            for freq, base_start, base_end in ranges:
+                wanted = [c for c in pending if any((key, c) not in done for key in keys_for[(freq, base_start, base_end)])]
+                aligned = aligned_for[(freq, base_start, base_end)]
+                with metrics.timer('align'):
+                    missing = {c: _slice(batch[c], base_start, base_end) for c in wanted if c not in aligned}
+                    if len(missing) > 0:
+                        raw = aggregate_series(missing, freq, aggregation).reindex(aligned.index)
+                        aligned.add(list(missing), raw.to_numpy())
+                    ### the transform works in float64 on this batch's columns of the panel ###
+                    panel = pd.DataFrame(aligned.values(wanted), index=aligned.index, columns=wanted, dtype=float)
+                    panels[(freq, base_start, base_end)] = transform_panel(panel, freq, pct_change)
+                if dedup is not None:
+                    with metrics.timer('dedup'):
+                        grouped[(freq, base_start, base_end)] = groups[(freq, base_start, base_end)].assign(
+                            panels[(freq, base_start, base_end)])
+            for key, freq, base, base_start, base_end in plans:
+                todo = [c for c in pending if (key, c) not in done]
+                representative = grouped.get((freq, base_start, base_end), {})
+                if len(todo) > 0:
+                    ### group members aren't correlated, they take their representative's stats ###
+                    members = [c for c in todo if c in representative]
+                    own = [c for c in todo if c not in representative]
+                    panel = panels[(freq, base_start, base_end)][own].reindex(base.index)
+                    memo = memo_for[key]
+                    with metrics.timer('correlate'):
+                        kept, stats = correlate_memo(memo, base.to_numpy(), panel, lag, screen, rolling)
+                    if dedup is not None:
+                        own_stats.update(((key, code), memo[code]) for code in own)
+                    if len(members) > 0:
+                        metrics.inc('duplicates_total', len(members))
+                        member_kept, member_stats = _member_stats(own_stats, done, key, members, representative, lag, screen, names)
+                        kept = kept + member_kept
+                        stats = {column: np.concatenate([stats[column], member_stats[column]], axis=1) for column in names}
+                    if journal is not None:
+                        journal.record(key, todo, kept, stats, representative)
+                    if len(todo) < len(pending) or len(members) > 0:
+                        kept, stats = _with_restored(pending, key, kept, stats, done, lag, names)
+                else:
+                    kept, stats = _with_restored(pending, key, [], None, done, lag, names)
+                if len(kept) > 0:
+                    with metrics.timer('assemble'):
+                        results.append_block(key, kept, stats,
+                                             [representative.get(c, restored_duplicates.get((key, c))) for c in kept])
+            if job is not None and len(results) > start:
+                job.publish(results.to_frame(start))
+            batch = {}
+            pending = []
+
+    ### rows were produced batch by batch; hand them back baseline by baseline ###
+    with metrics.timer('assemble'):
+        return results.to_frame(by_baseline=True)
@@ -0,0 +1,172 @@
+############ columnar accumulator for analysis results ##########################################
+############ rows are appended a block at a time into preallocated numpy arrays that grow by ######
+############ doubling, so building a results set stays linear in the number of rows. the ########
+############ DataFrame is only materialized once, at the end ####################################
+
+import numpy as np
+import pandas as pd
+
+from rolling import ROLLING_COLUMNS
+
+### column name -> dtype. correlations are kept as float32, p-values stay float64 ###
+### since significant p-values are often far below float32's smallest normal value ###
+COLUMN_DTYPES = {
+    'lag': np.int16,
+    'pearsoncorr': np.float32,
+    'pearson_pval': np.float64,
+    'spearmancorr': np.float32,
+    'spearman_pval': np.float64,
+}
+
+### the rolling-window summary added in rolling mode ###
+ROLLING_DTYPES = {name: np.float32 for name in ROLLING_COLUMNS}
+
+
+class ResultAccumulator:
+
+    def __init__(self, capacity=1024, columns=COLUMN_DTYPES, duplicates=False):
+        ### columns maps name -> dtype; stats passed to append_block need every one but lag. ###
+        ### duplicates adds a duplicate_of column naming each member series' representative ###
+        self.size = 0
+        self.duplicates = duplicates
+        self.columns = {name: np.empty(capacity, dtype=dtype) for name, dtype in columns.items()}
+        ### baseline file and series ID are stored as integer codes into these lists ###
+        self.baselines = []
+        self.codes = []
+        self._baseline_codes = np.empty(capacity, dtype=np.int32)
+        self._indicator_codes = np.empty(capacity, dtype=np.int32)
+        self._representative_codes = np.empty(capacity, dtype=np.int32)
+        self._baseline_lookup = {}
+        self._indicator_lookup = {}
+
+    def __len__(self):
+        return self.size
+
+    def _reserve(self, rows):
+        capacity = self._baseline_codes.shape[0]
+        if self.size + rows <= capacity:
+            return
+        while capacity < self.size + rows:
+            capacity *= 2
+        for name in self.columns:
+            grown = np.empty(capacity, dtype=self.columns[name].dtype)
+            grown[:self.size] = self.columns[name][:self.size]
+            self.columns[name] = grown
+        for name in ('_baseline_codes', '_indicator_codes', '_representative_codes'):
+            grown = np.empty(capacity, dtype=np.int32)
+            grown[:self.size] = getattr(self, name)[:self.size]
+            setattr(self, name, grown)
+
+    @staticmethod
+    def _code(value, values, lookup):
+        if value not in lookup:
+            lookup[value] = len(values)
+            values.append(value)
+        return lookup[value]
+
+    ### append every lag for a set of series against one baseline. stats maps each ####
+    ### result column to a (lags x series) array, as returned by lagged_correlations ###
+    ### rows come out grouped by series, lags 0..n within each series. representatives, ###
+    ### if given, holds each series' representative ID, or None for one that has none ####
+    def append_block(self, baseline, codes, stats, representatives=None):
+        n_lags = next(iter(stats.values())).shape[0]
+        rows = n_lags * len(codes)
+        self._reserve(rows)
+        block = slice(self.size, self.size + rows)
+
+        self.columns['lag'][block] = np.tile(np.arange(n_lags), len(codes))
+        for name in self.columns:
+            if name != 'lag':
+                self.columns[name][block] = stats[name].T.ravel()
+
+        self._baseline_codes[block] = self._code(baseline, self.baselines, self._baseline_lookup)
+        indicator_codes = np.array([self._code(c, self.codes, self._indicator_lookup) for c in codes], dtype=np.int32)
+        self._indicator_codes[block] = np.repeat(indicator_codes, n_lags)
+        representatives = representatives if representatives is not None else [None] * len(codes)
+        representative_codes = np.array([-1 if r is None else self._code(r, self.codes, self._indicator_lookup)
+                                         for r in representatives], dtype=np.int32)
+        self._representative_codes[block] = np.repeat(representative_codes, n_lags)
+        self.size += rows
+
+    ### build the results DataFrame, with categorical baseline and series columns. ####
+    ### start gives just the rows appended since then, for publishing partial results. ##
+    ### by_baseline puts the rows in baseline order, keeping their order within each ####
+    def to_frame(self, start=0, by_baseline=False):
+        rows = np.arange(start, self.size)
+        if by_baseline:
+            rows = rows[np.argsort(self._baseline_codes[rows], kind='stable')]
+        frame = pd.DataFrame({name: column[rows] for name, column in self.columns.items()})
+        frame['baseline_data'] = pd.Categorical.from_codes(self._baseline_codes[rows], categories=pd.Index(self.baselines, dtype=object))
+        frame['indicator_code'] = pd.Categorical.from_codes(self._indicator_codes[rows], categories=pd.Index(self.codes, dtype=object))
+        if self.duplicates:
+            frame['duplicate_of'] = pd.Categorical.from_codes(self._representative_codes[rows], categories=pd.Index(self.codes, dtype=object))
+        frame.index = pd.RangeIndex(start, self.size)
+        return frame
+
+
+### the results table can be filtered and sorted on the strength of these columns ###
+INDEXED_COLUMNS = ['pearsoncorr', 'spearmancorr']
+
+
+class ResultIndex:
+    ### a results frame plus, for each indexed column, the row positions sorted by ####
+    ### absolute value. threshold filters become a binary search, and the table is ####
+    ### served a page at a time instead of shipping every row to the browser ##########
+
+    def __init__(self, frame):
+        self.frame = frame.reset_index(drop=True)
+        self.strength = {}
+        self.order = {}
+        self.sorted = {}
+        for column in INDEXED_COLUMNS:
+            strength = np.abs(self.frame[column].to_numpy(dtype=float))
+            ### missing correlations sort first and never pass a threshold ###
+            strength[np.isnan(strength)] = -1
+            order = np.argsort(strength, kind='stable')
+            self.strength[column] = strength
+            self.order[column] = order
+            self.sorted[column] = strength[order]
+
+    def __len__(self):
+        return self.frame.shape[0]
+
+    ### positions of the rows at or above both thresholds. the column whose threshold ####
+    ### leaves fewer rows is binary searched, and only those rows are checked against ####
+    ### the other. positions come back sorted by the searched column, weakest first ######
+    def matching(self, pearson_thresh, spearman_thresh):
+        thresholds = dict(zip(INDEXED_COLUMNS, (pearson_thresh, spearman_thresh)))
+        n = len(self)
+        counts = {column: n - np.searchsorted(self.sorted[column], thresholds[column], side='left')
+                  for column in INDEXED_COLUMNS}
+        searched = min(INDEXED_COLUMNS, key=counts.get)
+        positions = self.order[searched][n - counts[searched]:]
+        for column in INDEXED_COLUMNS:
+            if column != searched:
+                positions = positions[self.strength[column][positions] >= thresholds[column]]
+        return positions, searched
+
+    ### one page of the matching rows, sorted on sort_by. the indexed columns sort by ####
+    ### absolute value, everything else by its own values ################################
+    def page(self, matching, sort_by, descending, page, page_size):
+        positions, searched = matching
+        if sort_by == searched:
+            ### already in order, so no sort is needed at all ###
+            ordered = positions[::-1] if descending else positions
+        else:
+            if sort_by in self.strength:
+                keys = self.strength[sort_by][positions]
+            else:
+                keys = self.frame[sort_by].iloc[positions]
+                if keys.dtype.name in ('category', 'object'):
+                    keys = keys.astype(str)
+                keys = keys.to_numpy()
+            order = np.argsort(keys, kind='stable')
+            ordered = positions[order[::-1] if descending else order]
+        return self.frame.iloc[ordered[page * page_size:(page + 1) * page_size]]
+
+    ### positions of every matching row, in the order the results were produced ###
+    def rows(self, matching):
+        return np.sort(matching[0])
+
+    def select(self, matching):
+        return self.frame.iloc[self.rows(matching)]
@@ -0,0 +1,115 @@
+############ rolling-window correlation engine ##################################################
+############ pearson and spearman correlations between the baseline and every series over each ####
+############ window of consecutive observations, at every lag. pearson comes from running sums ####
+############ (cumulative sums differenced a window apart), and spearman from window ranks that ####
+############ are updated as the window slides: each step only compares the value leaving and ####
+############ the value entering against the rest, instead of ranking the window again. each ######
+############ series is summarized over its windows: mean, spread and how often it is strong ######
+
+import warnings
+
+import numpy as np
+
+from correlation import _average_ranks
+
+ROLLING_COLUMNS = ['pearson_window_mean', 'pearson_window_std', 'pearson_window_frac',
+                   'spearman_window_mean', 'spearman_window_std', 'spearman_window_frac']
+
+### variance below this fraction of the window's sum of squares counts as a constant window ###
+CONSTANT_TOLERANCE = 1e-10
+
+
+### pearson r of x against every column of Y over each window, from running sums ###
+def rolling_pearson(x, Y, window):
+    ### centring first keeps the differenced sums from cancelling on large levels ###
+    x = x - x.mean()
+    Y = Y - Y.mean(axis=0)
+
+    def window_sums(a):
+        total = np.cumsum(a, axis=0)
+        return np.concatenate([total[window - 1:window], total[window:] - total[:-window]])
+
+    sx, sxx = window_sums(x), window_sums(x * x)
+    sY, sYY, sxY = window_sums(Y), window_sums(Y * Y), window_sums(x[:, None] * Y)
+    var_x = sxx - sx * sx / window
+    var_Y = sYY - sY * sY / window
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r = (sxY - sx[:, None] * sY / window) / np.sqrt(var_x[:, None] * var_Y)
+    r = np.clip(r, -1.0, 1.0)
+    constant = (var_x <= CONSTANT_TOLERANCE * sxx)[:, None] | (var_Y <= CONSTANT_TOLERANCE * sYY)
+    r[constant] = np.nan
+    return r
+
+
+def _window_ranks(values):
+    order = np.argsort(values, axis=0, kind='mergesort')
+    return _average_ranks(np.take_along_axis(values, order, axis=0), order)
+
+
+### move a window one step: the value in row slot leaves and new takes its place. ####
+### every other rank drops for a value leaving below it and rises for one entering ###
+### below it (half for ties), and only the new value's rank is counted in full #######
+def _slide_ranks(buffer, ranks, slot, new):
+    old = buffer[slot].copy()
+    ranks -= (old < buffer) + 0.5 * (old == buffer)
+    ranks += (new < buffer) + 0.5 * (new == buffer)
+    buffer[slot] = new
+    ranks[slot] = 1 + (buffer < new).sum(axis=0) + 0.5 * ((buffer == new).sum(axis=0) - 1)
+
+
+def _rank_correlation(x_ranks, Y_ranks):
+    xm = x_ranks - x_ranks.mean()
+    Ym = Y_ranks - Y_ranks.mean(axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r = (xm @ Ym) / np.sqrt((xm @ xm) * (Ym * Ym).sum(axis=0))
+    return np.clip(r, -1.0, 1.0)
+
+
+### spearman rho of x against every column of Y over each window. the buffers hold ####
+### the window's rows in slot order (row i lives in slot i % window), so x and Y ######
+### stay paired without shifting anything as the window slides #######################
+def rolling_spearman(x, Y, window):
+    n_windows = x.shape[0] - window + 1
+    x_buffer, Y_buffer = x[:window, None].copy(), Y[:window].copy()
+    x_ranks, Y_ranks = _window_ranks(x_buffer), _window_ranks(Y_buffer)
+    rho = np.empty((n_windows, Y.shape[1]))
+    rho[0] = _rank_correlation(x_ranks[:, 0], Y_ranks)
+    for i in range(1, n_windows):
+        slot = (i - 1) % window
+        _slide_ranks(x_buffer, x_ranks, slot, x[i + window - 1:i + window])
+        _slide_ranks(Y_buffer, Y_ranks, slot, Y[i + window - 1])
+        rho[i] = _rank_correlation(x_ranks[:, 0], Y_ranks)
+    return rho
+
+
+def _summarize(r, threshold):
+    ### windows with an undefined correlation are left out of the mean and spread, ####
+    ### and count as below the threshold ##############################################
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+        mean, std = np.nanmean(r, axis=0), np.nanstd(r, axis=0)
+    return mean, std, (np.abs(np.nan_to_num(r)) >= threshold).mean(axis=0)
+
+
+def rolling_summary(base, values, max_lag, window, threshold, min_lag=0):
+    ### same pairing as lagged_correlations: at lag i, base[i:] against values[:n-i]. ####
+    ### returns one (lags x series) array per entry of ROLLING_COLUMNS, for lags ########
+    ### min_lag..max_lag. lags with fewer observations than window are left as NaN ######
+    base = np.asarray(base, dtype=float)
+    values = np.asarray(values, dtype=float)
+    n_obs, n_series = values.shape
+
+    results = {column: np.full((max_lag + 1 - min_lag, n_series), np.nan) for column in ROLLING_COLUMNS}
+    for lag in range(min_lag, max_lag + 1):
+        rows = n_obs - lag
+        out = lag - min_lag
+        if rows < window or n_series == 0:
+            results['pearson_window_frac'][out] = 0
+            results['spearman_window_frac'][out] = 0
+            continue
+        x, Y = base[lag:], values[:rows]
+        for name, r in (('pearson', rolling_pearson(x, Y, window)), ('spearman', rolling_spearman(x, Y, window))):
+            summary = _summarize(r, threshold)
+            for column, value in zip(('_window_mean', '_window_std', '_window_frac'), summary):
+                results[name + column][out] = value
+    return results
@@ -0,0 +1,95 @@
+############ append-only journal of finished (baseline, series) pairs ###########################
+############ as an analysis runs, every batch of correlations is appended to a file named after ###
+############ the run's settings and flushed to disk. a run started again with the same settings ###
+############ and resume set reads the journal back and skips the pairs already finished, so a #####
+############ dropped connection, restart or FRED error doesn't mean repeating hours of API work ####
+
+import hashlib
+import json
+import os
+import threading
+
+import pandas as pd
+
+### where run journals are kept, can be set from the environment ###
+RUN_DIR = os.environ.get("FRED_RUN_DIR", "runs")
+
+
+def run_id(baselines, codes, lag, pct_change, aggregation='mean', screen=None, rolling=None, dedup=None):
+    ### a run's settings -> short hash. baselines are hashed by content, not file name alone ###
+    content = hashlib.sha256()
+    for key in baselines:
+        content.update(str(key).encode())
+        content.update(pd.util.hash_pandas_object(baselines[key], index=False).to_numpy().tobytes())
+    content.update(json.dumps([list(map(str, codes)), lag, pct_change, aggregation, screen, rolling, dedup]).encode())
+    return content.hexdigest()[:16]
+
+
+class RunJournal:
+
+    def __init__(self, path, resume=True):
+        ### completed maps (baseline, series ID) -> {column: list over lags}, or None for ####
+        ### a series that was left out (too little data, or below the screen). duplicates #
+        ### maps (baseline, series ID) -> representative ID for grouped series #############
+        self.path = path
+        self.completed = {}
+        self.duplicates = {}
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory != '':
+            os.makedirs(directory, exist_ok=True)
+        if resume and os.path.exists(path):
+            self._load()
+        else:
+            open(path, 'w').close()
+
+    @classmethod
+    def for_run(cls, baselines, codes, lag, pct_change, aggregation='mean', screen=None, resume=True, directory=RUN_DIR,
+                rolling=None, dedup=None):
+        name = run_id(baselines, codes, lag, pct_change, aggregation, screen, rolling, dedup) + ".jsonl"
+        return cls(os.path.join(directory, name), resume)
+
+    def _load(self):
+        good = 0
+        with open(self.path, 'rb') as f:
+            for line in f:
+                ### a write cut short by a crash; it and anything after it are dropped ###
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                self.completed[(record['baseline'], record['code'])] = record['stats']
+                if record.get('duplicate_of') is not None:
+                    self.duplicates[(record['baseline'], record['code'])] = record['duplicate_of']
+                good += len(line)
+        if good < os.path.getsize(self.path):
+            with open(self.path, 'r+b') as f:
+                f.truncate(good)
+
+    def __len__(self):
+        return len(self.completed)
+
+    def __contains__(self, pair):
+        return pair in self.completed
+
+    ### journal one baseline's batch: codes is every series correlated, kept and stats ####
+    ### are what correlate_panel returned for them. representatives maps grouped series ##
+    ### to their representative's ID ######################################################
+    def record(self, baseline, codes, kept, stats, representatives=None):
+        positions = {code: j for j, code in enumerate(kept)}
+        lines = []
+        for code in codes:
+            j = positions.get(code)
+            entry = None if j is None else {column: stats[column][:, j].tolist() for column in stats}
+            line = {'baseline': baseline, 'code': code, 'stats': entry}
+            if representatives is not None and code in representatives:
+                line['duplicate_of'] = representatives[code]
+                self.duplicates[(baseline, code)] = representatives[code]
+            lines.append(json.dumps(line) + "\n")
+            self.completed[(baseline, code)] = entry
+        with self._lock, open(self.path, 'a') as f:
+            f.writelines(lines)
+            f.flush()
+            os.fsync(f.fileno())
@@ -0,0 +1,117 @@
+############ concurrent scraper for FRED listing pages (tags, searches, releases) ################
+############ pages are fetched by a small pool of workers, each holding its own keep-alive ########
+############ httplib2 connection, with retry and backoff on failures. only the series links #######
+############ are parsed out of each page, and new (code, name) rows are streamed back as #########
+############ soon as their page completes ########################################################
+
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import httplib2
+from bs4 import BeautifulSoup, SoupStrainer
+
+import metrics
+
+### lxml is much faster than the built in parser, but fall back if it isn't installed ###
+try:
+    import lxml  # noqa: F401
+    PARSER = "lxml"
+except ImportError:
+    PARSER = "html.parser"
+
+SERIES_LINKS = SoupStrainer("a", href=re.compile("series/"))
+LAST_PAGE_LINK = SoupStrainer("a", title=re.compile("last page"))
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class ScrapeError(Exception):
+    pass
+
+
+class PageFetcher:
+
+    def __init__(self, retries=3, backoff=1.0, timeout=30):
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self._local = threading.local()
+
+    ### one Http object per thread: httplib2 keeps the connection open between ####
+    ### requests to the same host, but the object itself isn't thread safe #######
+    def _http(self):
+        if not hasattr(self._local, 'http'):
+            self._local.http = httplib2.Http(timeout=self.timeout)
+        return self._local.http
+
+    def get(self, url):
+        for attempt in range(self.retries + 1):
+            if attempt > 0:
+                metrics.inc('retries_total', source='scraper')
+            metrics.inc('api_calls_total', endpoint='listing_page')
+            try:
+                status, response = self._http().request(url, headers={"Connection": "keep-alive"})
+                if status.status not in RETRY_STATUSES:
+                    return response
+                error = ScrapeError("HTTP " + str(status.status) + " for " + url)
+            except (httplib2.HttpLib2Error, OSError) as e:
+                ### drop the connection so the next attempt opens a fresh one ###
+                self._local.http = httplib2.Http(timeout=self.timeout)
+                error = e
+            if attempt < self.retries:
+                time.sleep(self.backoff * 2 ** attempt)
+        raise error
+
+
+def page_url(url, page):
+    return url + ('&' if '?' in url else '?') + 'pageID=' + str(page)
+
+
+def parse_series_links(html):
+    soup = BeautifulSoup(html, PARSER, parse_only=SERIES_LINKS)
+    return [(link['href'].split('/')[-1], link.text.strip()) for link in soup.find_all("a")]
+
+
+def parse_page_count(html):
+    soup = BeautifulSoup(html, PARSER, parse_only=LAST_PAGE_LINK)
+    last = soup.find("a")
+    if last is None:
+        return 1
+    return int(last['href'].split('=')[-1])
+
+
+def scrape_series(url, on_rows, workers=8, fetcher=None):
+    ### on_rows is called with a list of {'Codes', 'Names'} dicts for the series ####
+    ### first seen on each page. series whose link has no text are skipped ########
+    fetcher = fetcher if fetcher is not None else PageFetcher()
+    with metrics.timer('scrape'):
+        _scrape(url, on_rows, workers, fetcher)
+
+
+def _scrape(url, on_rows, workers, fetcher):
+    first_page = fetcher.get(url)
+    max_pages = parse_page_count(first_page)
+    print("Scraping", max_pages, "pages from", url)
+
+    seen = set()
+
+    def add(links):
+        rows = []
+        for code, name in links:
+            if name != '' and code not in seen:
+                seen.add(code)
+                rows.append({'Codes': code, 'Names': name})
+        if len(rows) > 0:
+            on_rows(rows)
+
+    ### the first page is already here, so only the rest are fetched ###
+    add(parse_series_links(first_page))
+    if max_pages == 1:
+        return
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pages = [pool.submit(lambda p: parse_series_links(fetcher.get(page_url(url, p))), p) for p in range(2, max_pages + 1)]
+        for page in as_completed(pages):
+            add(page.result())
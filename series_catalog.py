@@ -0,0 +1,134 @@
+############ local snapshot of which FRED series live in which category #########################
+############ built once by crawling every leaf category in categories.csv, and stored as a ########
+############ parquet file next to it. the category search tab resolves selections against ########
+############ this snapshot and only goes to the API for categories that are missing or stale ######
+############
+############ build or refresh it with:
+############     python series_catalog.py [--max-age-days N]
+
+import argparse
+import json
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+import metrics
+from category_crawler import crawl_categories
+from category_index import CategoryIndex, ROOT_ID
+
+CATALOG_PATH = "series_catalog.parquet"
+DEFAULT_MAX_AGE_DAYS = 30
+
+### per-category fetch times are kept in the parquet schema metadata under this key ###
+FETCHED_AT_KEY = b"category_fetched_at"
+
+
+class SeriesCatalog:
+
+    def __init__(self, frame=None, fetched_at=None):
+        self.frame = frame if frame is not None else pd.DataFrame({'category_id': pd.Series(dtype='int64')})
+        self.fetched_at = fetched_at if fetched_at is not None else {}
+        self._rows = self.frame.groupby('category_id').indices
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path=CATALOG_PATH):
+        if not os.path.exists(path):
+            return cls()
+        ### pyarrow is imported here rather than at the top, so a server without a ####
+        ### catalog yet doesn't pay for it at boot and the warm-up thread loads it ####
+        import pyarrow.parquet as pq
+
+        table = pq.read_table(path)
+        metadata = table.schema.metadata or {}
+        fetched_at = {int(k): v for k, v in json.loads(metadata.get(FETCHED_AT_KEY, b"{}")).items()}
+        return cls(table.to_pandas(), fetched_at)
+
+    def save(self, path=CATALOG_PATH):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        with self._lock:
+            table = pa.Table.from_pandas(self.frame, preserve_index=False)
+            metadata = dict(table.schema.metadata or {})
+            metadata[FETCHED_AT_KEY] = json.dumps(self.fetched_at).encode()
+            table = table.replace_schema_metadata(metadata)
+            ### write next to the target and swap it in, so readers never see half a file ###
+            pq.write_table(table, path + ".tmp", compression="zstd")
+            os.replace(path + ".tmp", path)
+
+    ### series listed under the given categories, in the same shape the API returns ###
+    def series_for(self, category_ids):
+        with self._lock:
+            frame, row_index = self.frame, self._rows
+        positions = [row_index[i] for i in category_ids if i in row_index]
+        if len(positions) == 0:
+            return pd.DataFrame()
+        rows = frame.take(np.concatenate(positions))
+        return rows.drop(columns='category_id').reset_index(drop=True)
+
+    ### categories never fetched, or (with max_age_days) fetched too long ago ###
+    def stale_categories(self, category_ids, max_age_days=None):
+        now = time.time()
+        stale = []
+        for i in category_ids:
+            fetched = self.fetched_at.get(i)
+            if fetched is None or (max_age_days is not None and now - fetched > max_age_days * 86400):
+                stale.append(i)
+        return stale
+
+    ### replace the rows of the given categories with freshly fetched series ###
+    def update(self, series_by_category):
+        fresh = [pd.DataFrame(pages).assign(category_id=i) for i, pages in series_by_category.items() if len(pages) > 0]
+        with self._lock:
+            kept = self.frame[~self.frame['category_id'].isin(list(series_by_category))]
+            parts = ([kept] if kept.shape[0] > 0 else []) + fresh
+            if len(parts) > 0:
+                self.frame = pd.concat(parts, ignore_index=True)
+            else:
+                self.frame = kept
+            self._rows = self.frame.groupby('category_id').indices
+            now = time.time()
+            for i in series_by_category:
+                self.fetched_at[i] = now
+
+
+def refresh_categories(catalog, category_ids, make_fred, on_series=None, children=None, bucket=None):
+    ### pull the series for the given leaf categories from the API and record them ####
+    ### in the catalog. on_series, if given, also receives each page as it arrives ###
+    fetched = {i: [] for i in category_ids}
+
+    def collect(category_id, page):
+        fetched[category_id].extend(page)
+        if on_series is not None:
+            on_series(category_id, page)
+
+    with metrics.timer('crawl'):
+        crawl_categories(category_ids, collect, make_fred, children=children, bucket=bucket)
+    catalog.update(fetched)
+    return fetched
+
+
+if __name__ == "__main__":
+    from full_fred.fred import Fred
+
+    parser = argparse.ArgumentParser(description="Build or refresh the local FRED series catalog.")
+    parser.add_argument("--categories", default="categories.csv", help="category tree to crawl")
+    parser.add_argument("--path", default=CATALOG_PATH, help="catalog file to write")
+    parser.add_argument("--max-age-days", type=float, default=None,
+                        help="only refresh categories older than this; by default every category is crawled again")
+    args = parser.parse_args()
+
+    index = CategoryIndex.load(args.categories)
+    catalog = SeriesCatalog.load(args.path)
+    leaves = index.leaf_categories([ROOT_ID])
+    if args.max_age_days is not None:
+        leaves = catalog.stale_categories(leaves, args.max_age_days)
+
+    print("Crawling", len(leaves), "categories", time.ctime())
+    refresh_categories(catalog, leaves, lambda: Fred('api_key.txt'), children=lambda i: index.children.get(i, []))
+    catalog.save(args.path)
+    print("Catalog written to", args.path, "with", catalog.frame.shape[0], "series", time.ctime())
@@ -0,0 +1,111 @@
+############ process-wide cache of fetched series, shared by every session ######################
+############ fetched frames are kept in memory, least recently used dropped first once the ########
+############ total size goes over the limit. when several sessions ask for the same series at #####
+############ the same time, only the first goes to the store/API and the rest wait on its result. #
+############ an entry can carry an expiry time, after which it is loaded again ####################
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import metrics
+
+### memory limit for the cached frames, can be set from the environment ###
+DEFAULT_MAX_MB = float(os.environ.get("FRED_SHARED_CACHE_MB", 256))
+
+
+def _size(frame):
+    return int(frame.memory_usage(index=True, deep=True).sum())
+
+
+class SeriesCache:
+
+    def __init__(self, max_bytes=DEFAULT_MAX_MB * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._entries = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    ### return the frame cached under key, or call load() to produce it. concurrent ####
+    ### callers with the same key share a single load() call. expires, if given, ######
+    ### maps a loaded frame to the time.time() after which it must be loaded again #####
+    def get(self, key, load, expires=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] is not None and time.time() >= entry[2]:
+                self.bytes -= self._entries.pop(key)[1]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                metrics.inc('cache_hits_total', cache='shared_series')
+                return entry[0]
+            waiting = self._in_flight.get(key)
+            if waiting is None:
+                leader = Future()
+                self._in_flight[key] = leader
+
+        if waiting is not None:
+            metrics.inc('cache_hits_total', cache='shared_series_in_flight')
+            return waiting.result()
+
+        metrics.inc('cache_misses_total', cache='shared_series')
+        try:
+            frame = load()
+        except BaseException as e:
+            ### waiters see the same error, and the next caller tries again ###
+            with self._lock:
+                del self._in_flight[key]
+            leader.set_exception(e)
+            raise
+
+        with self._lock:
+            del self._in_flight[key]
+            self._put(key, frame, expires(frame) if expires is not None else None)
+        leader.set_result(frame)
+        return frame
+
+    def _put(self, key, frame, expires_at=None):
+        size = _size(frame)
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self.bytes -= self._entries.pop(key)[1]
+        self._entries[key] = (frame, size, expires_at)
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            _, (_, dropped, _) = self._entries.popitem(last=False)
+            self.bytes -= dropped
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+
+class CachedObservations:
+    ### an ObservationStore with the shared cache in front of it. frames are shared ####
+    ### between sessions, so callers must not modify what they get back. a frame ######
+    ### expires when the store's copy goes stale, so the store's TTL still applies #####
+
+    def __init__(self, store, cache):
+        self.store = store
+        self.cache = cache
+
+    @property
+    def api_calls(self):
+        return self.store.api_calls
+
+    @property
+    def thread_api_calls(self):
+        return self.store.thread_api_calls
+
+    def get_series_df(self, fred, series_id, observation_start, observation_end):
+        key = (series_id, str(observation_start), str(observation_end))
+        return self.cache.get(key, lambda: self.store.get_series_df(fred, series_id, observation_start, observation_end),
+                              lambda frame: frame.attrs['fetched_at'] + self.store.ttl_seconds)
@@ -0,0 +1,45 @@
+############ sample data, a FRED stand-in and a small analysis run, shared by the tests ##########
+
+import numpy as np
+import pandas as pd
+
+from observation_store import ObservationStore
+from pipeline import run_analysis
+
+
+def sample(n_obs=40, n_series=12, seed=0):
+    rng = np.random.default_rng(seed)
+    base = rng.normal(size=n_obs)
+    values = rng.normal(size=(n_obs, n_series))
+    ### rounded columns give the rank paths ties to average ###
+    values[:, ::3] = values[:, ::3].round(0)
+    return base, values
+
+
+class FakeFred:
+    ### quarterly random walks, the same for a series ID on every call. an ID like ####
+    ### SERIES3_X2 is SERIES3 scaled by 2, i.e. an exact duplicate of it ##############
+
+    def get_series_df(self, series_id, observation_start, observation_end):
+        name, _, scale = series_id.partition('_X')
+        dates = pd.date_range('1995-01-01', '2020-10-01', freq='QS')
+        values = np.cumsum(np.random.default_rng(sum(map(ord, name))).normal(size=dates.shape[0])) + 100
+        values = values * float(scale or 1)
+        keep = (dates >= pd.Timestamp(observation_start)) & (dates <= pd.Timestamp(observation_end))
+        return pd.DataFrame({'date': dates[keep].strftime('%Y-%m-%d'), 'value': [str(v) for v in values[keep]]})
+
+
+def baselines(n=2):
+    ### n quarterly baselines, each starting a quarter after the last, so no two ####
+    ### share a date range ##########################################################
+    dates = pd.date_range('2000-01-01', periods=40 + n, freq='QS')
+    return {'baseline' + str(i) + '.csv': pd.DataFrame({'Date': dates[i:i + 40].strftime('%Y-%m-%d'),
+                                                        'value': np.random.default_rng(i).normal(size=40)})
+            for i in range(n)}
+
+
+def run(tmp_path, lag=4, n_baselines=2, codes=None, batch_size=3, **kwargs):
+    codes = codes if codes is not None else ['SERIES' + str(i) for i in range(10)]
+    store = ObservationStore(str(tmp_path / 'store.sqlite'))
+    return run_analysis(baselines(n_baselines), codes, lag, 1, store, FakeFred(), batch_size=batch_size,
+                        throttle_calls=None, **kwargs)
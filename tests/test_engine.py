@@ -0,0 +1,56 @@
+############ checks on the correlation engines and on duplicate grouping ########################
+############ the vectorized engines are compared pair by pair with scipy, and runs that group ####
+############ duplicates with runs that correlate every series. run from the repository root: ####
+############
+############     python -m pytest -q tests
+
+import numpy as np
+import pandas as pd
+import pytest
+from scipy.stats import pearsonr, spearmanr
+
+from correlation import lagged_correlations
+from dedup import DuplicateGroups
+from helpers import run, sample
+
+TOLERANCE = 1e-12
+
+
+def test_lagged_correlations_match_scipy():
+    base, values = sample()
+    max_lag = 5
+    results = lagged_correlations(base, values, max_lag)
+    n_obs = values.shape[0]
+    for lag in range(max_lag + 1):
+        x, Y = base[lag:], values[:n_obs - lag]
+        for j in range(values.shape[1]):
+            r, p = pearsonr(x, Y[:, j])
+            rho, p_rho = spearmanr(x, Y[:, j])
+            assert results['pearsoncorr'][lag, j] == pytest.approx(r, abs=TOLERANCE)
+            assert results['pearson_pval'][lag, j] == pytest.approx(p, rel=1e-9, abs=TOLERANCE)
+            assert results['spearmancorr'][lag, j] == pytest.approx(rho, abs=TOLERANCE)
+            assert results['spearman_pval'][lag, j] == pytest.approx(p_rho, rel=1e-9, abs=TOLERANCE)
+
+
+def test_duplicate_groups_find_scaled_copies():
+    _, values = sample(n_series=6)
+    panel = pd.DataFrame(np.hstack([values, values * 3 + 1]), columns=['S' + str(j) for j in range(12)])
+    ### a gap in one copy puts it on a different observation pattern from its original ###
+    panel.iloc[0, 11] = np.nan
+    assert DuplicateGroups(0.999).assign(panel) == {'S' + str(j + 6): 'S' + str(j) for j in range(5)}
+
+
+### each batch evicted the memo a group's members read their representative's stats ###
+### from, once the baselines outnumbered the cache, and the members were dropped #######
+@pytest.mark.parametrize("n_baselines", [2, 10])
+def test_grouped_run_matches_full_run(tmp_path, n_baselines):
+    codes = ['SERIES' + str(i) for i in range(6)] + ['SERIES' + str(i) + '_X2' for i in range(6)]
+    full = run(tmp_path, n_baselines=n_baselines, codes=codes, batch_size=6)
+    grouped = run(tmp_path, n_baselines=n_baselines, codes=codes, batch_size=6, dedup=0.999)
+    assert set(grouped.dropna(subset=['duplicate_of']).indicator_code) == set(codes[6:])
+
+    order = ['baseline_data', 'indicator_code', 'lag']
+    grouped = grouped.drop(columns='duplicate_of').sort_values(order).reset_index(drop=True)
+    full = full.sort_values(order).reset_index(drop=True)
+    assert len(grouped) == n_baselines * len(codes) * 5
+    pd.testing.assert_frame_equal(grouped, full, check_categorical=False)
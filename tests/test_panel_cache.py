@@ -0,0 +1,51 @@
+############ checks that runs reusing a PanelCache give what a clean run gives ###################
+
+import numpy as np
+import pandas as pd
+
+import pipeline
+from correlation import lagged_correlations
+from helpers import run, sample
+from observation_store import ObservationStore
+from panel_cache import PanelCache
+
+
+def test_lagged_correlations_extend_lags():
+    base, values = sample()
+    full = lagged_correlations(base, values, 6)
+    head, tail = lagged_correlations(base, values, 2), lagged_correlations(base, values, 6, min_lag=3)
+    for column in full:
+        np.testing.assert_array_equal(np.concatenate([head[column], tail[column]]), full[column])
+
+
+def test_extended_lags_match_clean_run(tmp_path):
+    cache = PanelCache()
+    run(tmp_path, lag=2, cache=cache)
+    pd.testing.assert_frame_equal(run(tmp_path, lag=6, cache=cache), run(tmp_path, lag=6))
+
+
+### ten baselines with their own ranges need ten panels and ten memos, more than a ###
+### single cache of sixteen entries held, so the rerun started over from scratch #####
+def test_extended_lags_reuse_every_baseline(tmp_path, monkeypatch):
+    codes = ['SERIES' + str(i) for i in range(20)]
+    cache = PanelCache()
+    run(tmp_path, lag=2, n_baselines=10, codes=codes, cache=cache)
+
+    fetched, cells = [], []
+    get_series_df, lagged = ObservationStore.get_series_df, pipeline.lagged_correlations
+
+    def counted_fetch(self, fred, code, *args):
+        fetched.append(code)
+        return get_series_df(self, fred, code, *args)
+
+    def counted_lags(base, values, lag, min_lag=0):
+        cells.append((lag + 1 - min_lag) * values.shape[1])
+        return lagged(base, values, lag, min_lag)
+
+    monkeypatch.setattr(ObservationStore, 'get_series_df', counted_fetch)
+    monkeypatch.setattr(pipeline, 'lagged_correlations', counted_lags)
+    extended = run(tmp_path, lag=3, n_baselines=10, codes=codes, cache=cache)
+    assert fetched == []
+    assert sum(cells) == 10 * len(codes)
+    monkeypatch.undo()
+    pd.testing.assert_frame_equal(extended, run(tmp_path, lag=3, n_baselines=10, codes=codes))
@@ -0,0 +1,23 @@
+############ checks on the rolling-window engines, window by window against scipy ###############
+
+import pytest
+from scipy.stats import pearsonr, spearmanr
+
+from helpers import sample
+from rolling import rolling_pearson, rolling_spearman
+
+TOLERANCE = 1e-12
+
+
+### a constant window has no correlation; scipy warns and both give NaN ###
+@pytest.mark.filterwarnings("ignore::scipy.stats.ConstantInputWarning")
+@pytest.mark.parametrize("window", [5, 12])
+def test_rolling_windows_match_scipy(window):
+    base, values = sample(n_obs=30, n_series=6, seed=1)
+    pearson = rolling_pearson(base, values, window)
+    spearman = rolling_spearman(base, values, window)
+    for i in range(base.shape[0] - window + 1):
+        x, Y = base[i:i + window], values[i:i + window]
+        for j in range(values.shape[1]):
+            assert pearson[i, j] == pytest.approx(pearsonr(x, Y[:, j])[0], abs=1e-9, nan_ok=True)
+            assert spearman[i, j] == pytest.approx(spearmanr(x, Y[:, j])[0], abs=TOLERANCE, nan_ok=True)
@@ -0,0 +1,22 @@
+############ checks that a run resumed from its journal gives what a clean run gives ############
+
+import pandas as pd
+
+from helpers import run
+from run_journal import RunJournal
+
+
+def test_resumed_run_matches_clean_run(tmp_path):
+    clean = run(tmp_path)
+    journal = RunJournal(str(tmp_path / 'run.jsonl'))
+    run(tmp_path, journal=journal)
+
+    ### cut the journal off part way through a line, as a crash would ###
+    with open(journal.path, 'rb') as f:
+        content = f.read()
+    with open(journal.path, 'wb') as f:
+        f.write(content[:len(content) // 2])
+
+    resumed = RunJournal(journal.path)
+    assert 0 < len(resumed) < 20
+    pd.testing.assert_frame_equal(run(tmp_path, journal=resumed), clean)
@@ -0,0 +1,77 @@
+############ startup timing and background warm-up of heavy imports ############################
+############ the click handlers import their heavy modules (scipy, full_fred, bs4, httplib2, ####
+############ pyarrow...) lazily so the server boots quickly. right after boot those imports are ##
+############ run once on a background thread, so the first click in a session doesn't pay for ###
+############ them either. each startup step is timed, printed, and shown in the Diagnostics tab ##
+
+import importlib
+import threading
+import time
+from contextlib import contextmanager
+
+### when this module was first imported, i.e. close to process start ###
+STARTED = time.perf_counter()
+
+### the modules the handlers import, heaviest first ###
+WARM_MODULES = [
+    'scipy.stats',
+    'pyarrow.parquet',
+    'pipeline',
+    'results_store',
+    'scraper',
+    'full_fred.fred',
+    'ingest',
+    'run_journal',
+    'jobs',
+]
+
+_lock = threading.Lock()
+_steps = []
+
+
+def record(step, seconds):
+    with _lock:
+        _steps.append((step, seconds))
+
+
+@contextmanager
+def step(name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - started)
+
+
+def _warm(modules):
+    started = time.perf_counter()
+    for module in modules:
+        try:
+            with step("import " + module):
+                importlib.import_module(module)
+        except ImportError as e:
+            print("Warm-up could not import", module + ":", e)
+    record("warm-up total", time.perf_counter() - started)
+    print(summary())
+
+
+### import modules on a daemon thread; returns the thread ###
+def warm_imports(modules=WARM_MODULES):
+    thread = threading.Thread(target=_warm, args=(list(modules),), name="warm-imports", daemon=True)
+    thread.start()
+    return thread
+
+
+def summary():
+    with _lock:
+        steps = list(_steps)
+    return "Startup: " + ", ".join(name + " " + str(round(seconds, 3)) + " s" for name, seconds in steps)
+
+
+### one row per startup step, for display ###
+def report():
+    import pandas as pd
+
+    with _lock:
+        steps = list(_steps)
+    return pd.DataFrame([{'step': name, 'seconds': round(seconds, 4)} for name, seconds in steps], columns=['step', 'seconds'])